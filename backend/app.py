@@ -12,12 +12,13 @@ backend_root = os.path.abspath(os.path.dirname(__file__))
 if backend_root not in sys.path:
     sys.path.insert(0, backend_root)
 
-from flask import Blueprint, Flask, jsonify, render_template, redirect, url_for, request, session, send_from_directory, flash,  abort
+from flask import Blueprint, Flask, jsonify, render_template, redirect, url_for, request, session, send_from_directory, flash,  abort, stream_with_context
 from jinja2 import FileSystemLoader
 from datetime import datetime, timedelta, date
 from matplotlib.dates import relativedelta
 import requests
-from sqlalchemy import text
+from sqlalchemy import text, func, or_
+from sqlalchemy.orm import joinedload
 from functools import wraps
 from werkzeug.utils import secure_filename
 import xmlrpc
@@ -25,18 +26,27 @@ from backend.models import MutualFundHolding, MutualFundTransaction
 from backend.extension import db, migrate
 from backend.models import CalendarEvent, Company, MutualFund, MutualFundHolding, MutualFundNAV, User, StockPortfolio, StockTransaction, SystemLog, ProjectCategory, Project, ProjectTask, ProjectTeam, ProjectMilestone, ProjectDocument, ProjectActivity 
 from backend.services.utils import get_period_label, get_investment_time_series, get_period_range_profit_loss, get_balance_sheet_period_range, format_balance_sheet_value, get_project_stats, create_initial_project_categories, calculate_project_progress, map_analytic_account, log_project_activity, prepare_chart_data, prepare_investment_chart_data, calculate_profit_loss, calculate_expenses, calculate_liabilities, calculate_assets, calculate_working_capital, calculate_detailed_assets_liabilities
-from backend.services.mutual_fund_service import get_mutual_fund_holdings, get_mutual_fund_performance, update_mutual_fund_nav, add_mutual_fund_transaction, get_mutual_fund_summary_by_category
+from backend.services.fund_performance_service import get_fund_performance, invalidate_fund_performance
+from backend.services.mutual_fund_service import get_mutual_fund_holdings, get_mutual_fund_holdings_page, get_mutual_fund_performance, update_mutual_fund_nav, add_mutual_fund_transaction, get_mutual_fund_summary_by_category, get_mutual_fund_overview, parse_nav_file, import_mutual_fund_navs, get_nav_series
 from backend.services.investment_service import get_investment_report, get_detailed_investments, get_realised_gain_details, get_profit_loss_totals, get_balance_sheet_totals, get_unrealised_gain_detail, get_cash_flow_account, get_cash_flow_transaction_detail, get_total_loans, get_dividends_details, get_fund_income, get_equity_income, get_equity_investment, get_fund_investment, get_monthly_profit_data, get_monthly_expense_data, get_monthly_liability_data, get_monthly_asset_data
 from backend.services.investment_service import calculate_portfolio_growth, calculate_weekly_growth_rate, calculate_profit_revenue, calculate_total_investment
 from backend.services.stock_service import StockService
+from backend.services.stock_history_service import StockHistoryService
+from backend.services.project_stats_service import get_project_statistics, invalidate_project_statistics
+from backend.services.pagination import keyset_paginate, get_page_size, DEFAULT_PAGE_SIZE
 from backend.services.associates_service import AssociatesService
-from backend.services.whattsapp_notification import send_whatsapp_notification, format_phone_number
+from backend.services.associate_upload_service import start_associate_upload, get_associate_upload, PROGRESS_STREAM_TIMEOUT
+from backend.services.notification_service import dispatch_event_notifications
+from backend.services.scheduler_service import start_scheduler
 from dotenv import load_dotenv 
 from backend.routes.odoo_routes import odoo_bp
 import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import hashlib
+import csv
+import io
+import zlib
+import tempfile
+import time
 from sqlalchemy import inspect
 
 # Add the project root to Python path
@@ -113,6 +123,14 @@ def create_app():
     app.config['WHATSAPP_ACCOUNT_SID'] = os.environ.get('WHATSAPP_ACCOUNT_SID')
     app.config['WHATSAPP_AUTH_TOKEN'] = os.environ.get('WHATSAPP_AUTH_TOKEN')
     app.config['WHATSAPP_FROM_NUMBER'] = os.environ.get('WHATSAPP_FROM_NUMBER')
+    app.config['WHATSAPP_RATE_LIMIT'] = float(os.environ.get('WHATSAPP_RATE_LIMIT', 5))  # messages per second
+
+    # Nightly stock maintenance runs on an in-process scheduler (see scheduler_service)
+    app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+
+    # Notifications are sent from a local thread pool;
+    # NOTIFICATION_TRANSPORT='fake' records messages in memory instead of sending them
+    app.config['NOTIFICATION_TRANSPORT'] = os.environ.get('NOTIFICATION_TRANSPORT', 'live')
 
     # In your app.py, add this custom filter
     @app.template_filter('format_currency')
@@ -158,6 +176,7 @@ def create_app():
         create_initial_project_categories()
     # ensure models are registered
     register_routes(app)
+    start_scheduler(app)
 
     # Register the sync blueprint
     app.register_blueprint(odoo_bp)
@@ -994,8 +1013,37 @@ def register_routes(app):
     @app.route('/admin/schedule_calendar/events', methods=['GET'])
     @role_required(['super_admin', 'Group_Chief_accountant', 'viewer'])
     def get_calendar_events():
+        # FullCalendar sends the visible range as ISO strings, only load events overlapping it
+        query = CalendarEvent.query
+        try:
+            window_start = request.args.get('start')
+            window_end = request.args.get('end')
+            if window_start:
+                window_start = datetime.fromisoformat(window_start.replace('Z', '+00:00')).replace(tzinfo=None)
+                query = query.filter(CalendarEvent.end_datetime > window_start)
+            if window_end:
+                window_end = datetime.fromisoformat(window_end.replace('Z', '+00:00')).replace(tzinfo=None)
+                query = query.filter(CalendarEvent.start_datetime < window_end)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid start or end date'}), 400
+        
+        # Cheap fingerprint of the window so unchanged views can be answered with 304
+        count, max_id, last_updated = query.with_entities(
+            func.count(CalendarEvent.id),
+            func.max(CalendarEvent.id),
+            func.max(CalendarEvent.updated_at)
+        ).one()
+        etag = hashlib.md5(
+            f'{window_start}|{window_end}|{count}|{max_id}|{last_updated}'.encode()
+        ).hexdigest()
+        
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
         # Get events from database
-        events = CalendarEvent.query.all()
+        events = query.options(joinedload(CalendarEvent.organizer)).order_by(CalendarEvent.start_datetime).all()
         
         # Format events for FullCalendar
         events_data = []
@@ -1012,7 +1060,10 @@ def register_routes(app):
                 'attendees': json.loads(event.attendees) if event.attendees else []
             })
         
-        return jsonify(events_data)
+        response = jsonify(events_data)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
 
     @app.route('/admin/schedule_calendar/create_event', methods=['POST'])
     @role_required(['super_admin', 'Group_Chief_accountant', 'viewer'])
@@ -1044,14 +1095,8 @@ def register_routes(app):
             db.session.add(new_event)
             db.session.commit()
             
-            # Send email if requested
-            if new_event.send_email and new_event.attendees:
-                send_calendar_notification(new_event)
-
-            # Send WhatsApp if requested
-            if new_event.send_whatsapp and new_event.whatsapp_numbers:
-                phone_numbers = json.loads(new_event.whatsapp_numbers)
-                send_whatsapp_notification(new_event, phone_numbers)
+            # Email/WhatsApp notifications are sent in the background
+            dispatch_event_notifications(new_event)
             
             return jsonify({'success': True, 'message': 'Event created successfully', 'id': new_event.id})
         
@@ -1083,14 +1128,8 @@ def register_routes(app):
             
             db.session.commit()
             
-            # Send email if requested
-            if event.send_email and event.attendees:
-                send_calendar_notification(event)
-
-            # Send WhatsApp if requested
-            if event.send_whatsapp and event.whatsapp_numbers:
-                phone_numbers = json.loads(event.whatsapp_numbers)
-                send_whatsapp_notification(event, phone_numbers)
+            # Email/WhatsApp notifications are sent in the background
+            dispatch_event_notifications(event)
             
             return jsonify({'success': True, 'message': 'Event updated successfully'})
         
@@ -1114,96 +1153,6 @@ def register_routes(app):
             app.logger.error(f"Error deleting event: {str(e)}")
             return jsonify({'success': False, 'message': str(e)}), 500
 
-    def send_calendar_notification(event):
-        """Send email notification for calendar event"""
-        try:
-            # Email configuration
-            smtp_server = app.config.get('SMTP_SERVER', 'smtp.gmail.com')
-            smtp_port = app.config.get('SMTP_PORT', 587)
-            email_address = app.config.get('EMAIL_ADDRESS', '')
-            email_password = app.config.get('EMAIL_PASSWORD', '')
-            
-            # Check if we have email credentials
-            if not email_address or not email_password:
-                app.logger.error("Email credentials not configured properly")
-                app.logger.error(f"Email: {email_address}, Password: {'Set' if email_password else 'Not set'}")
-                return False
-                
-            # Parse attendees
-            attendee_emails = json.loads(event.attendees) if event.attendees else []
-            if not attendee_emails:
-                app.logger.warning("No attendees to send email to")
-                return False
-            
-            app.logger.info(f"Recipients: {attendee_emails}")
-            app.logger.info(f"Event: {event.title}")
-            
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = email_address
-            msg['To'] = ', '.join(attendee_emails)
-            msg['Subject'] = event.email_subject or f"{event.title}"
-            
-            # Create email body
-            body = f"""
-             <!DOCTYPE html>
-                <html lang="en">
-                <head>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>Event Invitation</title>
-                </head>
-                <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
-                    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-                        <h1 style="color: white; margin: 0;">Event Invitation</h1>
-                    </div>
-                    
-                    <div style="padding: 20px; border: 1px solid #ddd; border-top: none;">
-                        <h2 style="color: #764ba2; margin-top: 0;">{event.title}</h2>
-                        
-                        <div style="background-color: #f9f9f9; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-                            <p style="margin: 0;"><strong>Date & Time:</strong> {event.start_datetime.strftime('%A, %B %d, %Y at %I:%M %p')}</p>
-                            <p style="margin: 5px 0 0 0;"><strong>Duration:</strong> {(event.end_datetime - event.start_datetime).seconds // 3600} hours</p>
-                        </div>
-                        
-                        <div style="margin-bottom: 20px;">
-                            <h3 style="color: #764ba2; margin-bottom: 10px;">Event Details</h3>
-                            <p><strong>Description:</strong> {event.description or 'No description provided'}</p>
-                            <p><strong>Location:</strong> {event.location or 'Not specified'}</p>
-                            <p><strong>Event Type:</strong> {event.event_type.title()}</p>
-                            <p><strong>Organizer:</strong> {event.organizer.username}</p>
-                        </div>
-                        
-                        <div style="background-color: #f0f8ff; padding: 15px; border-radius: 5px; border-left: 4px solid #764ba2;">
-                            <h3 style="color: #764ba2; margin-top: 0;">Additional Message</h3>
-                            <p style="margin: 0;">{event.email_message or 'You are invited to this event. Please mark your calendar.'}</p>
-                        </div>
-                        
-                        <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee;">
-                            <p style="font-size: 0.9em; color: #777;">
-                                This is an automated message. Please do not reply to this email.
-                            </p>
-                        </div>
-                    </div>
-                </body>
-            </html>
-            """
-            
-            msg.attach(MIMEText(body, 'html'))
-            
-            # Send email
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(email_address, email_password)
-                server.sendmail(email_address, attendee_emails, msg.as_string())
-                
-            app.logger.info(f"Email notification sent for event: {event.title}")
-            return True
-                
-        except Exception as e:
-            app.logger.error(f"Failed to send email notification: {str(e)}")
-            return False
-    
     @app.route('/admin/dividends')
     @role_required(['super_admin', 'Group_Chief_accountant'])
     def admin_dividends():
@@ -1520,33 +1469,24 @@ def register_routes(app):
         
         # Get all mutual funds for dropdowns
         all_funds = MutualFund.query.filter_by(is_active=True).all()
-
-        # Query holdings properly
-        holdings = MutualFundHolding.query.all()
-
-        # If you also need mutual funds:
-        funds = MutualFund.query.all()
-
-        # Instead, add the None check here:
-        for holding_item in holdings:
-            if holding_item.unrealized_gain_loss is None:
-                holding_item.unrealized_gain_loss = 0.0
         
         # Initialize empty performance data if no funds exist
         if not all_funds:
             performance_data = {
-                'holdings': [],
                 'total_investment': 0,
                 'total_current_value': 0,
                 'total_gain_loss': 0,
                 'total_gain_loss_percent': 0,
-                'count': 0
+                'count': 0,
+                'returns': None
             }
             category_summary = []
         else:
-            # Get mutual fund data only if funds exist
-            performance_data = get_mutual_fund_performance(start_date, end_date)
-            category_summary = get_mutual_fund_summary_by_category(start_date, end_date)
+            # Header totals and category summary come from one aggregate query
+            performance_data, category_summary = get_mutual_fund_overview(start_date, end_date)
+        
+        # The holdings table renders the first page, the rest is lazy-loaded
+        holdings, next_cursor = get_mutual_fund_holdings_page(start_date, end_date)
         
         return render_template(
             'mutual_funds/admin_mutual_funds.html', 
@@ -1557,9 +1497,44 @@ def register_routes(app):
             start_date=start_date,
             end_date=end_date,
             holdings=holdings,
-            funds=funds
+            next_cursor=next_cursor
         )
 
+    @app.route('/api/mutual_funds/returns')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'viewer'])
+    def mutual_fund_returns_api():
+        """XIRR, time-weighted return and max drawdown per holding, category and for the book"""
+        try:
+            as_of = request.args.get('as_of')
+            as_of = datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else None
+            return jsonify({'success': True, **get_fund_performance(as_of)})
+        
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Error computing mutual fund returns: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/mutual_funds/holdings/page')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'viewer'])
+    def list_mutual_fund_holdings_api():
+        try:
+            holdings, next_cursor = get_mutual_fund_holdings_page(
+                request.args.get('start_date'),
+                request.args.get('end_date'),
+                cursor=request.args.get('cursor'),
+                limit=get_page_size(request.args.get('limit'))
+            )
+            return jsonify({
+                'success': True,
+                'html': render_template('mutual_funds/_holding_rows.html', holdings=holdings),
+                'next_cursor': next_cursor
+            })
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @app.route('/api/mutual_funds/update_nav', methods=['POST'])
     @role_required(['super_admin', 'Group_Chief_accountant'])
     def update_mutual_fund_nav_route():
@@ -1594,6 +1569,33 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)})
 
+    @app.route('/api/mutual_funds/import_nav', methods=['POST'])
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def import_mutual_fund_nav_route():
+        """API endpoint to bulk import NAVs from a CSV file (fund_code, date, nav) or JSON rows"""
+        try:
+            if 'file' in request.files:
+                rows = parse_nav_file(request.files['file'].read().decode('utf-8-sig'))
+            else:
+                data = request.get_json() or {}
+                rows = [{
+                    'fund_code': row['fund_code'],
+                    'nav_date': datetime.strptime(row['nav_date'], '%Y-%m-%d').date(),
+                    'nav_value': Decimal(str(row['nav_value'])),
+                    'repurchase_price': Decimal(str(row['repurchase_price'])) if row.get('repurchase_price') else None,
+                    'sale_price': Decimal(str(row['sale_price'])) if row.get('sale_price') else None
+                } for row in data.get('navs', [])]
+                if not rows:
+                    return jsonify({'success': False, 'error': 'No NAV rows provided'}), 400
+            
+            result = import_mutual_fund_navs(rows)
+            return jsonify({'success': True, 'message': f"Imported {result['imported']} NAVs", **result})
+            
+        except (ValueError, KeyError, InvalidOperation) as e:
+            return jsonify({'success': False, 'error': f'Invalid NAV data: {str(e)}'}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @app.route('/api/mutual_funds/add_fund', methods=['POST'])
     @role_required(['super_admin', 'Group_Chief_accountant'])
     def add_mutual_fund():
@@ -1675,9 +1677,9 @@ def register_routes(app):
                     'purchase_nav': float(holding['holding'].purchase_nav),
                     'purchase_value': float(holding['holding'].purchase_value),
                     'current_nav': float(holding['current_nav'] or 0),
-                    'current_value': float(holding['holding'].current_value or 0),
-                    'unrealized_gain_loss': float(holding['holding'].unrealized_gain_loss or 0),
-                    'unrealized_gain_loss_percent': float(holding['holding'].unrealized_gain_loss_percent or 0),
+                    'current_value': float(holding['current_value'] or 0),
+                    'unrealized_gain_loss': float(holding['unrealized_gain_loss'] or 0),
+                    'unrealized_gain_loss_percent': float(holding['unrealized_gain_loss_percent'] or 0),
                     'folio_number': holding['holding'].folio_number
                 })
             
@@ -1715,6 +1717,7 @@ def register_routes(app):
             
             db.session.add(holding)
             db.session.commit()
+            invalidate_fund_performance()
             
             return jsonify({
                 'success': True,
@@ -1726,11 +1729,55 @@ def register_routes(app):
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)})
 
+    def nav_series_response(fund_ids):
+        """Run a NAV series request for the given funds, answering 304 when the client copy is current"""
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        interval = request.args.get('interval', 'daily')
+        points = min(max(int(request.args.get('points', 500)), 3), 5000)
+        
+        series = get_nav_series(tuple(sorted(set(fund_ids))), start_date, end_date, interval, points)
+        payload = {
+            'success': True,
+            'interval': interval,
+            'funds': [{'fund_id': fund_id, **data} for fund_id, data in series.items()]
+        }
+        
+        etag = hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(payload)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @app.route('/api/mutual_funds/nav_history')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'viewer'])
+    def get_mutual_funds_nav_series():
+        """NAV history for several funds (?fund_ids=1,2,3) over a date range, optionally downsampled"""
+        try:
+            fund_ids = [int(fund_id) for fund_id in request.args.get('fund_ids', '').split(',') if fund_id.strip()]
+            if not fund_ids:
+                return jsonify({'success': False, 'error': 'fund_ids is required'}), 400
+            return nav_series_response(fund_ids)
+        
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Error building NAV series: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @app.route('/api/mutual_funds/<int:fund_id>/nav_history')
     @role_required(['super_admin', 'Group_Chief_accountant', 'viewer'])
     def get_mutual_fund_nav_history(fund_id):
-        """API endpoint to get NAV history for a fund"""
+        """API endpoint to get NAV history for a fund (the last 30 NAVs unless a range or interval is given)"""
         try:
+            if any(request.args.get(arg) for arg in ('start_date', 'end_date', 'interval')):
+                return nav_series_response([fund_id])
+            
             nav_history = MutualFundNAV.query.filter_by(
                 fund_id=fund_id
             ).order_by(MutualFundNAV.nav_date.desc()).limit(30).all()
@@ -1747,6 +1794,8 @@ def register_routes(app):
                 'nav_history': formatted_data
             })
             
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)})
     
@@ -1903,6 +1952,7 @@ def register_routes(app):
             
             db.session.delete(holding)
             db.session.commit()
+            invalidate_fund_performance()
             
             return jsonify({
                 'success': True,
@@ -1960,6 +2010,7 @@ def register_routes(app):
                 holding.folio_number = data['folio_number']
             
             db.session.commit()
+            invalidate_fund_performance()
             
             return jsonify({
                 'success': True,
@@ -2033,8 +2084,19 @@ def register_routes(app):
     @role_required(['super_admin', 'Group_Chief_accountant'])
     def get_associates_summary():
         try:
-            summary = AssociatesService.get_all_companies_summary()
-            return jsonify(summary)
+            summary, version = AssociatesService.get_summary_snapshot()
+            if version is None:
+                return jsonify(AssociatesService.get_all_companies_summary())
+            
+            # The snapshot only changes when an upload bumps its version
+            etag = f'associates-summary-v{version}'
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = jsonify(summary)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
         except Exception as e:
             print(f"Error getting summary: {e}")
             return jsonify({})
@@ -2073,6 +2135,16 @@ def register_routes(app):
             print(f"Error getting comparison data: {e}")
             return jsonify({'error': 'Failed to get comparison data'}), 500
 
+    @app.route('/api/associates/metric-catalogue')
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def get_associates_metric_catalogue():
+        """Metrics with the companies and years that have data for them"""
+        try:
+            return jsonify(AssociatesService.get_metric_catalogue())
+        except Exception as e:
+            print(f"Error getting metric catalogue: {e}")
+            return jsonify({'version': None, 'metrics': []})
+
     @app.route('/api/associates/available-metrics')
     @role_required(['super_admin', 'Group_Chief_accountant'])
     def get_available_metrics():
@@ -2083,6 +2155,76 @@ def register_routes(app):
         except Exception as e:
             print(f"Error getting available metrics: {e}")
             return jsonify([])
+
+    @app.route('/api/associates/upload', methods=['POST'])
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def upload_associates_workbook():
+        """Queue an associates workbook (.xlsx) for upload in the background"""
+        file = request.files.get('file')
+        if not file or not file.filename:
+            return jsonify({'success': False, 'error': 'No workbook provided'}), 400
+        
+        filename = secure_filename(file.filename)
+        if os.path.splitext(filename)[1].lower() != '.xlsx':
+            return jsonify({'success': False, 'error': 'Only .xlsx workbooks are supported'}), 400
+        
+        fd, path = tempfile.mkstemp(prefix='associates-', suffix='.xlsx')
+        os.close(fd)
+        try:
+            file.save(path)
+            job_id = start_associate_upload(path, filename, session.get('username'))
+        except RuntimeError as e:
+            os.remove(path)
+            return jsonify({'success': False, 'error': str(e)}), 409
+        except Exception as e:
+            db.session.rollback()
+            os.remove(path)
+            app.logger.error(f"Error queueing associates upload: {str(e)}")
+            return jsonify({'success': False, 'error': 'Failed to queue upload'}), 500
+        
+        return jsonify({
+            'success': True,
+            'job': get_associate_upload(job_id),
+            'status_url': url_for('get_associates_upload', job_id=job_id),
+            'progress_url': url_for('stream_associates_upload', job_id=job_id)
+        }), 202
+
+    @app.route('/api/associates/upload/<job_id>')
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def get_associates_upload(job_id):
+        job = get_associate_upload(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Upload not found'}), 404
+        return jsonify({'success': True, 'job': job})
+
+    @app.route('/api/associates/upload/<job_id>/progress')
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def stream_associates_upload(job_id):
+        """Stream an upload's progress as NDJSON, one line per change, until it finishes"""
+        if get_associate_upload(job_id) is None:
+            return jsonify({'success': False, 'error': 'Upload not found'}), 404
+        
+        def generate():
+            last = None
+            deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT.total_seconds()
+            while time.monotonic() < deadline:
+                job = get_associate_upload(job_id)
+                # Job state is written by whichever worker runs it: end the read transaction so
+                # the next poll sees its commits, and don't hold a connection while sleeping
+                db.session.remove()
+                if job is None:
+                    break
+                if job != last:
+                    yield json.dumps(job) + '\n'
+                    last = job
+                if job['status'] in ('done', 'failed'):
+                    break
+                time.sleep(0.5)
+        
+        response = app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
         
 
     @app.route('/admin/logout')
@@ -2298,6 +2440,169 @@ def register_routes(app):
             return redirect(url_for("admin_dashboard"))
    
 
+    ODOO_MOVE_LINE_FIELDS = [
+        'date', 'company_id', 'account_id', 'amount_currency', 
+        'credit', 'debit', 'balance', 'name', 'move_name', 'partner_id',
+        'analytic_distribution'  # Added analytic_distribution
+    ]
+
+    TRANSACTION_EXPORT_COLUMNS = [
+        'date', 'company', 'account_code', 'account_name', 'amount_currency', 'credit', 'debit',
+        'balance', 'label', 'number', 'partner', 'analytic_amount', 'analytic_department',
+        'analytic_employees', 'analytic_ho', 'analytic_inter_companies', 'analytic_investment_at_cost',
+        'analytic_investment_at_fv', 'analytic_investment_at_oci', 'analytic_investment_in_fund'
+    ]
+
+    def fetch_analytic_account_names(models, db, uid, password, records, known=None):
+        """Map the analytic account ids used by `records` to their names, skipping ids already in `known`"""
+        analytic_account_map = dict(known or {})
+        
+        analytic_account_ids = set()
+        for record in records:
+            analytic_distribution = record.get('analytic_distribution', {})
+            if analytic_distribution:
+                # Convert keys to integers since Odoo returns them as strings
+                for analytic_id_str in analytic_distribution.keys():
+                    try:
+                        analytic_account_ids.add(int(analytic_id_str))
+                    except (ValueError, TypeError):
+                        print(f"Invalid analytic ID: {analytic_id_str}")
+        
+        analytic_account_ids -= set(analytic_account_map)
+        
+        # Fetch analytic account names if we have any
+        if analytic_account_ids:
+            try:
+                analytic_accounts = models.execute_kw(
+                    db, uid, password,
+                    'account.analytic.account', 'read',
+                    [list(analytic_account_ids)],
+                    {'fields': ['name', 'code']}
+                )
+                for account in analytic_accounts:
+                    analytic_account_map[account['id']] = account.get('name', account.get('code', f"Account {account['id']}"))
+            except Exception as e:
+                print(f"Error fetching analytic accounts: {str(e)}")
+                # If we can't fetch analytic accounts, create a simple mapping
+                for analytic_id in analytic_account_ids:
+                    analytic_account_map[analytic_id] = f"Account {analytic_id}"
+        
+        return analytic_account_map
+
+    def format_move_line(record, analytic_account_map):
+        """Flatten an account.move.line record into the transaction export row"""
+        company = record.get('company_id', [])
+        account = record.get('account_id', [])
+        partner = record.get('partner_id', [])
+        
+        # Analytic fields, filled by mapping each analytic account to its column
+        analytic_fields = {column: '' for column in TRANSACTION_EXPORT_COLUMNS if column.startswith('analytic_')}
+        
+        # Process analytic distribution if it exists
+        analytic_distribution = record.get('analytic_distribution', {})
+        if analytic_distribution:
+            for analytic_id_str, percentage in analytic_distribution.items():
+                try:
+                    analytic_id = int(analytic_id_str)
+                    analytic_name = analytic_account_map.get(analytic_id, f"Account {analytic_id}")
+                    
+                    # Map the analytic account to the appropriate field based on its name
+                    field_name, display_name = map_analytic_account(analytic_name, analytic_id)
+                    
+                    # Set the value in the appropriate field (use the name, not the percentage)
+                    if field_name in analytic_fields:
+                        analytic_fields[field_name] = display_name
+                except (ValueError, TypeError) as e:
+                    print(f"Error processing analytic ID {analytic_id_str}: {str(e)}")
+        
+        return {
+            'date': record.get('date', ''),
+            'company': company[1] if company and len(company) > 1 else company[0] if company else '',
+            'account_code': account[1].split(' ')[0] if account and len(account) > 1 else '',
+            'account_name': ' '.join(account[1].split(' ')[1:]) if account and len(account) > 1 else account[1] if account and len(account) > 1 else account[0] if account else '',
+            'amount_currency': record.get('amount_currency', ''),
+            'credit': record.get('credit', ''),
+            'debit': record.get('debit', ''),
+            'balance': record.get('balance', ''),
+            'label': record.get('name', ''),
+            'number': record.get('move_name', ''),
+            'partner': partner[1] if partner and len(partner) > 1 else partner[0] if partner else '',
+            **analytic_fields
+        }
+
+    def stream_move_lines(models, db, uid, password, domain, export_format, batch_size=500):
+        """
+        Stream account.move.line rows (newest first) as NDJSON or CSV, gzip-compressed when the
+        client accepts it. Rows are read from Odoo in keyset batches on (date, id) so only one
+        batch is held in memory at a time.
+        """
+        use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+        
+        def generate_rows():
+            analytic_account_map = {}
+            last = None
+            
+            if export_format == 'csv':
+                header = io.StringIO()
+                csv.writer(header).writerow(TRANSACTION_EXPORT_COLUMNS)
+                yield header.getvalue()
+            
+            while True:
+                batch_domain = list(domain)
+                if last:
+                    # (date, id) < (last_date, last_id), in Odoo's prefix notation
+                    batch_domain += ['|', ('date', '<', last[0]), '&', ('date', '=', last[0]), ('id', '<', last[1])]
+                
+                records = models.execute_kw(
+                    db, uid, password,
+                    'account.move.line', 'search_read',
+                    [batch_domain],
+                    {'fields': ODOO_MOVE_LINE_FIELDS, 'order': 'date desc, id desc', 'limit': batch_size}
+                )
+                if not records:
+                    break
+                
+                analytic_account_map = fetch_analytic_account_names(models, db, uid, password, records, analytic_account_map)
+                
+                chunk = io.StringIO()
+                writer = csv.writer(chunk) if export_format == 'csv' else None
+                for record in records:
+                    row = format_move_line(record, analytic_account_map)
+                    if writer:
+                        writer.writerow([row[column] for column in TRANSACTION_EXPORT_COLUMNS])
+                    else:
+                        chunk.write(json.dumps(row, default=str) + '\n')
+                yield chunk.getvalue()
+                
+                if len(records) < batch_size:
+                    break
+                last = (records[-1]['date'], records[-1]['id'])
+        
+        def generate():
+            if not use_gzip:
+                for data in generate_rows():
+                    yield data.encode('utf-8')
+                return
+            
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+            for data in generate_rows():
+                compressed = compressor.compress(data.encode('utf-8'))
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+        
+        extension = 'csv' if export_format == 'csv' else 'ndjson'
+        response = app.response_class(
+            generate(),
+            mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename=transactions.{extension}'
+        response.headers['X-Accel-Buffering'] = 'no'
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
     @app.route('/fetch_transactions')
     def fetch_transactions():
         try:
@@ -2337,6 +2642,11 @@ def register_routes(app):
                 ('date', '<=', end_date)
             ]
             
+            # Streamed export: keyset batches straight from Odoo to the client
+            export_format = request.args.get('format', 'json')
+            if export_format in ('ndjson', 'csv'):
+                return stream_move_lines(models, db, uid, password, domain, export_format)
+            
             # First, check how many records we have (for progress)
             total_count = models.execute_kw(
                 db, uid, password,
@@ -2352,28 +2662,7 @@ def register_routes(app):
                     'message': f'No transactions found for company "{company_name}" from {start_date} to {end_date}'
                 })
             
-            # Get the fields available in account.move.line model
-            try:
-                available_fields = models.execute_kw(
-                    db, uid, password,
-                    'account.move.line', 'fields_get',
-                    [], {'attributes': ['string', 'type']}
-                )
-                
-                # Create a list of fields we want to try to fetch
-                desired_fields = [
-                    'date', 'company_id', 'account_id', 'amount_currency', 
-                    'credit', 'debit', 'balance', 'name', 'move_name', 'partner_id',
-                    'analytic_distribution'  # Added analytic_distribution
-                ]
-                
-            except:
-                # If we can't get fields info, use a safe default
-                desired_fields = [
-                    'date', 'company_id', 'account_id', 'amount_currency', 
-                    'credit', 'debit', 'balance', 'name', 'move_name', 'partner_id',
-                    'analytic_distribution'  # Added analytic_distribution
-                ]
+            desired_fields = ODOO_MOVE_LINE_FIELDS
             
             # Search for account.move.line records with our domain - with reasonable limit
             line_ids = models.execute_kw(
@@ -2398,113 +2687,8 @@ def register_routes(app):
                 all_records.extend(records)
             
             # Format the records for display
-            formatted_records = []
-            analytic_account_map = {} 
-            
-            # First, let's get analytic account names if we have any analytic distributions
-            analytic_account_ids = set()
-            for record in all_records:
-                analytic_distribution = record.get('analytic_distribution', {})
-                if analytic_distribution:
-                    # Convert keys to integers since Odoo returns them as strings
-                    for analytic_id_str in analytic_distribution.keys():
-                        try:
-                            analytic_account_ids.add(int(analytic_id_str))
-                        except (ValueError, TypeError):
-                            print(f"Invalid analytic ID: {analytic_id_str}")
-            
-            # Fetch analytic account names if we have any
-            if analytic_account_ids:
-                try:
-                    analytic_accounts = models.execute_kw(
-                        db, uid, password,
-                        'account.analytic.account', 'read',
-                        [list(analytic_account_ids)],
-                        {'fields': ['name', 'code']}
-                    )
-                    for account in analytic_accounts:
-                        analytic_account_map[account['id']] = account.get('name', account.get('code', f"Account {account['id']}"))
-                    print(f"Fetched {len(analytic_accounts)} analytic accounts: {analytic_account_map}")
-                except Exception as e:
-                    print(f"Error fetching analytic accounts: {str(e)}")
-                    # If we can't fetch analytic accounts, create a simple mapping
-                    for analytic_id in analytic_account_ids:
-                        analytic_account_map[analytic_id] = f"Account {analytic_id}"
-            
-            for record in all_records:
-                company = record.get('company_id', [])
-                account = record.get('account_id', [])
-                partner = record.get('partner_id', [])
-                
-                # Initialize analytic fields
-                analytic_amount = ''
-                analytic_department = ''
-                analytic_employees = ''
-                analytic_ho = ''
-                analytic_inter_companies = ''
-                analytic_investment_at_cost = ''
-                analytic_investment_at_fv = ''
-                analytic_investment_at_oci = ''
-                analytic_investment_in_fund = ''
-                
-                # Process analytic distribution if it exists
-                analytic_distribution = record.get('analytic_distribution', {})
-                if analytic_distribution:
-                    print(f"Processing analytic distribution: {analytic_distribution}")
-                    for analytic_id_str, percentage in analytic_distribution.items():
-                        try:
-                            analytic_id = int(analytic_id_str)
-                            analytic_name = analytic_account_map.get(analytic_id, f"Account {analytic_id}")
-                            print(f"Analytic ID: {analytic_id}, Name: {analytic_name}")
-                            
-                            # Map the analytic account to the appropriate field based on its name
-                            field_name, display_name = map_analytic_account(analytic_name, analytic_id)
-                            print(f"Mapped to field: {field_name}, Display name: {display_name}")
-                            
-                            # Set the value in the appropriate field (use the name, not the percentage)
-                            if field_name == 'analytic_amount':
-                                analytic_amount = display_name
-                            elif field_name == 'analytic_department':
-                                analytic_department = display_name
-                            elif field_name == 'analytic_employees':
-                                analytic_employees = display_name
-                            elif field_name == 'analytic_ho':
-                                analytic_ho = display_name
-                            elif field_name == 'analytic_inter_companies':
-                                analytic_inter_companies = display_name
-                            elif field_name == 'analytic_investment_at_cost':
-                                analytic_investment_at_cost = display_name
-                            elif field_name == 'analytic_investment_at_fv':
-                                analytic_investment_at_fv = display_name
-                            elif field_name == 'analytic_investment_at_oci':
-                                analytic_investment_at_oci = display_name
-                            elif field_name == 'analytic_investment_in_fund':
-                                analytic_investment_in_fund = display_name
-                        except (ValueError, TypeError) as e:
-                            print(f"Error processing analytic ID {analytic_id_str}: {str(e)}")
-                
-                formatted_records.append({
-                    'date': record.get('date', ''),
-                    'company': company[1] if company and len(company) > 1 else company[0] if company else '',
-                    'account_code': account[1].split(' ')[0] if account and len(account) > 1 else '',
-                    'account_name': ' '.join(account[1].split(' ')[1:]) if account and len(account) > 1 else account[1] if account and len(account) > 1 else account[0] if account else '',
-                    'amount_currency': record.get('amount_currency', ''),
-                    'credit': record.get('credit', ''),
-                    'debit': record.get('debit', ''),
-                    'balance': record.get('balance', ''),
-                    'label': record.get('name', ''),
-                    'number': record.get('move_name', ''),
-                    'partner': partner[1] if partner and len(partner) > 1 else partner[0] if partner else '',
-                    'analytic_amount': analytic_amount,
-                    'analytic_department': analytic_department,
-                    'analytic_employees': analytic_employees,
-                    'analytic_ho': analytic_ho,
-                    'analytic_inter_companies': analytic_inter_companies,
-                    'analytic_investment_at_cost': analytic_investment_at_cost,
-                    'analytic_investment_at_fv': analytic_investment_at_fv,
-                    'analytic_investment_at_oci': analytic_investment_at_oci,
-                    'analytic_investment_in_fund': analytic_investment_in_fund
-                })
+            analytic_account_map = fetch_analytic_account_names(models, db, uid, password, all_records)
+            formatted_records = [format_move_line(record, analytic_account_map) for record in all_records]
             
             # Sort records by date (newest first)
             formatted_records.sort(key=lambda x: x['date'], reverse=True)
@@ -2525,60 +2709,88 @@ def register_routes(app):
     @app.route('/admin/stock_view')
     @role_required(['super_admin', 'Group_Chief_accountant', 'portfolio_manager'])
     def admin_stock_view():
-        """Main stock portfolio view"""
-        stocks = StockPortfolio.query.all()
-
-        # Auto-update all stock values including YTD
-        for stock in stocks:
-            stock.update_values()
-        
-        # Initialize year-start prices for stocks that don't have them
-        current_year = datetime.now().year
-        from backend.models import StockYearStartPrice
-        
-        for stock in stocks:
-            if stock.no_of_shares > 0:
-                existing_price = StockYearStartPrice.query.filter_by(
-                    stock_id=stock.id, year=current_year
-                ).first()
-                
-                if not existing_price and stock.market_price:
-                    # Create current year price record if missing
-                    year_start_price = StockYearStartPrice(
-                        stock_id=stock.id,
-                        year=current_year,
-                        price=stock.market_price,  # Use current price as fallback
-                        recorded_date=datetime.now().date()
-                    )
-                    db.session.add(year_start_price)
+        """Main stock portfolio view (read-only, valuations are kept current on writes and by the scheduler)"""
+        search_query = request.args.get('search', '')
+        performance_filter = request.args.get('filter', 'all')
         
-        db.session.commit()
+        stocks, next_cursor = get_stocks_page(search_query, performance_filter)
         
-        # Calculate portfolio totals with proper None handling
-        total_investment = sum(float(stock.total_cost_basis or 0) for stock in stocks)
-        total_current_value = sum(float(stock.current_value or 0) for stock in stocks)
-        total_gain_loss = sum(float(stock.unrealized_gain_loss or 0) for stock in stocks)
-        total_ytd_gain_loss = sum(float(stock.unrealized_ytd_gain_loss or 0) for stock in stocks)
+        return render_template(
+            'stock/admin_stock_view.html', 
+            stocks=stocks,
+            next_cursor=next_cursor,
+            search_query=search_query,
+            performance_filter=performance_filter,
+            portfolio_totals=get_portfolio_totals(),
+            current_year=datetime.now().year
+        )
+
+    def get_portfolio_totals():
+        """Calculate portfolio totals in the database with proper None handling"""
+        totals = db.session.query(
+            func.count(StockPortfolio.id),
+            func.coalesce(func.sum(StockPortfolio.total_cost_basis), 0),
+            func.coalesce(func.sum(StockPortfolio.current_value), 0),
+            func.coalesce(func.sum(StockPortfolio.unrealized_gain_loss), 0),
+            func.coalesce(func.sum(StockPortfolio.unrealized_ytd_gain_loss), 0)
+        ).one()
+        
+        stock_count = totals[0]
+        total_investment = float(totals[1])
+        total_current_value = float(totals[2])
+        total_gain_loss = float(totals[3])
+        total_ytd_gain_loss = float(totals[4])
         
         if total_investment > 0:
             gain_loss_percent = (total_gain_loss / total_investment) * 100
         else:
             gain_loss_percent = 0
         
-        portfolio_totals = {
+        return {
+            'stock_count': stock_count,
             'total_investment': total_investment,
             'total_current_value': total_current_value,
             'total_gain_loss': total_gain_loss,
             'total_ytd_gain_loss': total_ytd_gain_loss,
             'gain_loss_percent': gain_loss_percent
         }
+
+    def get_stocks_page(search_query, performance_filter, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Get one page of portfolio stocks matching the search and profit/loss filter"""
+        query = StockPortfolio.query
         
-        return render_template(
-            'stock/admin_stock_view.html', 
-            stocks=stocks,
-            portfolio_totals=portfolio_totals,
-            current_year=datetime.now().year
-        )
+        if search_query:
+            query = query.filter(or_(
+                StockPortfolio.company_name.ilike(f'%{search_query}%'),
+                StockPortfolio.ticker_symbol.ilike(f'%{search_query}%')
+            ))
+        
+        if performance_filter == 'profit':
+            query = query.filter(StockPortfolio.unrealized_gain_loss > 0)
+        elif performance_filter == 'loss':
+            query = query.filter(StockPortfolio.unrealized_gain_loss < 0)
+        
+        return keyset_paginate(query, [StockPortfolio.id], cursor=cursor, limit=limit, descending=False)
+
+    @app.route('/api/stocks')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'portfolio_manager'])
+    def list_stocks_api():
+        try:
+            stocks, next_cursor = get_stocks_page(
+                request.args.get('search', ''),
+                request.args.get('filter', 'all'),
+                cursor=request.args.get('cursor'),
+                limit=get_page_size(request.args.get('limit'))
+            )
+            return jsonify({
+                'success': True,
+                'html': render_template('stock/_stock_rows.html', stocks=stocks),
+                'next_cursor': next_cursor
+            })
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
 
     @app.route('/stock/create', methods=['POST'])
     @role_required(['super_admin', 'Group_Chief_accountant'])
@@ -2616,17 +2828,47 @@ def register_routes(app):
         """View transaction history for a specific stock"""
         try:
             stock = StockPortfolio.query.get_or_404(stock_id)
-            transactions = StockTransaction.query.filter_by(stock_id=stock_id).order_by(StockTransaction.transaction_date.desc()).all()
+            transactions, next_cursor = get_stock_transactions_page(stock_id)
             
             return render_template(
                 'stock/admin_transaction_history.html', 
                 stock=stock, 
-                transactions=transactions
+                transactions=transactions,
+                next_cursor=next_cursor
             )
         except Exception as e:
             app.logger.error(f"Error loading transactions: {str(e)}")
             flash("Error loading transaction history", 'danger')
             return redirect(url_for('admin_stock_view'))
+
+    def get_stock_transactions_page(stock_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Get one page of a stock's transactions, newest first"""
+        return keyset_paginate(
+            StockTransaction.query.filter_by(stock_id=stock_id),
+            [StockTransaction.transaction_date, StockTransaction.id],
+            cursor=cursor,
+            limit=limit
+        )
+
+    @app.route('/api/stock/<int:stock_id>/transactions')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'portfolio_manager'])
+    def list_stock_transactions_api(stock_id):
+        try:
+            stock = StockPortfolio.query.get_or_404(stock_id)
+            transactions, next_cursor = get_stock_transactions_page(
+                stock_id,
+                cursor=request.args.get('cursor'),
+                limit=get_page_size(request.args.get('limit'))
+            )
+            return jsonify({
+                'success': True,
+                'html': render_template('stock/_transaction_rows.html', stock=stock, transactions=transactions),
+                'next_cursor': next_cursor
+            })
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
     
     # Buy more stock routes
     @app.route('/stock/buy_more/<int:stock_id>', methods=['GET'])
@@ -2748,38 +2990,107 @@ def register_routes(app):
         
         return redirect(url_for('admin_stock_view'))
     
+    @app.route('/api/stock/performance')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'portfolio_manager'])
+    def stock_performance_api():
+        """Daily portfolio market value and cost basis for the performance chart"""
+        try:
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+            
+            points = min(max(int(request.args.get('points', 365)), 2), 2000)
+            
+            series = StockHistoryService.get_valuation_series(start_date, end_date, max_points=points)
+            return jsonify({'success': True, **series})
+        
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Error building stock performance series: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/stock/market_prices', methods=['POST'])
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def bulk_update_market_prices():
+        """Update market prices for many stocks from a CSV upload or JSON body in one transaction"""
+        try:
+            if 'file' in request.files:
+                default_date = request.form.get('date') or datetime.now().date()
+                payload = request.files['file'].read().decode('utf-8-sig')
+            else:
+                data = request.get_json() or {}
+                default_date = data.get('date') or datetime.now().date()
+                payload = data.get('prices')
+            
+            prices = StockService.parse_market_prices(payload, default_date)
+            result = StockService.bulk_update_market_prices(prices)
+            db.session.commit()
+            
+            return jsonify({'success': True, **result})
+        
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error updating market prices: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/stock/position_check', methods=['GET', 'POST'])
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def stock_position_check():
+        """Compare stored position snapshots with a full replay; POST also rebuilds inconsistent stocks"""
+        try:
+            stock_id = request.args.get('stock_id', type=int)
+            mismatches = StockService.check_position_snapshots(stock_id)
+            
+            repaired = []
+            if request.method == 'POST' and mismatches:
+                repaired = sorted({m['stock_id'] for m in mismatches})
+                for mismatched_stock_id in repaired:
+                    StockService.recalculate_stock_from_transactions(mismatched_stock_id)
+                db.session.commit()
+            
+            return jsonify({
+                'success': True,
+                'consistent': not mismatches,
+                'mismatches': mismatches,
+                'repaired_stock_ids': repaired
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/admin/stock_refresh_valuations', methods=['POST'])
+    @role_required(['super_admin', 'Group_Chief_accountant'])
+    def stock_refresh_valuations():
+        """Recompute valuations for all stocks on demand"""
+        try:
+            count = StockService.refresh_valuations()
+            flash(f'Valuations refreshed for {count} stocks.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error refreshing valuations: {str(e)}', 'error')
+        
+        return redirect(url_for('admin_stock_view'))
+
     @app.route('/admin/stock_year_end_process', methods=['POST'])
     @role_required(['super_admin', 'Group_Chief_accountant'])
     def stock_year_end_process():
         """Process year-end prices for all stocks"""
         try:
-            from backend.models import StockPortfolio, StockYearStartPrice
+            next_year = datetime.now().year + 1
             
-            current_year = datetime.now().year
-            next_year = current_year + 1
-            
-            stocks = StockPortfolio.query.all()
-            processed_count = 0
-            
-            for stock in stocks:
-                if stock.market_price:
-                    # Create year-start price record for next year
-                    existing_price = StockYearStartPrice.query.filter_by(
-                        stock_id=stock.id, year=next_year
-                    ).first()
-                    
-                    if not existing_price:
-                        year_start_price = StockYearStartPrice(
-                            stock_id=stock.id,
-                            year=next_year,
-                            price=stock.market_price,
-                            recorded_date=datetime.now().date()
-                        )
-                        db.session.add(year_start_price)
-                        processed_count += 1
+            # Create year-start price records for next year in one statement
+            processed_count = StockService.rollover_year_start_prices(next_year)
             
             db.session.commit()
-            flash(f'Year-end prices captured for {processed_count} stocks. Ready for {next_year} YTD calculations.', 'success')
+            if processed_count:
+                flash(f'Year-end prices captured for {processed_count} stocks. Ready for {next_year} YTD calculations.', 'success')
+            else:
+                flash(f'Year-start prices for {next_year} were already captured; nothing changed.', 'info')
             
         except Exception as e:
             db.session.rollback()
@@ -2810,6 +3121,7 @@ def register_routes(app):
             old_price = transaction.price_per_share
             old_total = transaction.total_amount
             old_type = transaction.transaction_type
+            old_date = transaction.transaction_date
             
             # Update transaction
             transaction.transaction_date = datetime.strptime(
@@ -2820,8 +3132,10 @@ def register_routes(app):
             transaction.total_amount = transaction.shares * transaction.price_per_share
             transaction.notes = request.form.get('notes')
             
-            # Recalculate entire stock portfolio from scratch
-            StockService.recalculate_stock_from_transactions(stock.id)
+            # Replay positions from the earlier of the old and new dates onwards
+            StockService.recalculate_stock_from_transactions(
+                stock.id, min(old_date, transaction.transaction_date), transaction.id
+            )
             
             db.session.commit()
             flash('Transaction updated successfully! Stock portfolio recalculated.', 'success')
@@ -2840,11 +3154,12 @@ def register_routes(app):
         try:
             transaction = StockTransaction.query.get_or_404(transaction_id)
             stock_id = transaction.stock_id
+            deleted_date = transaction.transaction_date
             
             db.session.delete(transaction)
             
-            # Recalculate entire stock portfolio from scratch
-            StockService.recalculate_stock_from_transactions(stock_id)
+            # Replay positions from the deleted transaction onwards
+            StockService.recalculate_stock_from_transactions(stock_id, deleted_date, transaction_id)
             
             db.session.commit()
             flash('Transaction deleted successfully! Stock portfolio recalculated.', 'success')
@@ -2868,20 +3183,7 @@ def register_routes(app):
         status_filter = request.args.get('status', 'all')
         search_query = request.args.get('search', '')
         
-        # Base query
-        query = Project.query
-
-        # Apply filters
-        if category_filter != 'all':
-            query = query.join(ProjectCategory).filter(ProjectCategory.name == category_filter)
-        
-        if status_filter != 'all':
-            query = query.filter(Project.status == status_filter)
-        
-        if search_query:
-            query = query.filter(Project.title.ilike(f'%{search_query}%'))
-        
-        projects = query.order_by(Project.created_at.desc()).all()
+        projects, next_cursor = get_projects_page(category_filter, status_filter, search_query)
         
         # Get project statistics
         stats = get_project_stats() 
@@ -2912,6 +3214,10 @@ def register_routes(app):
 
         return render_template('projects/admin_projects.html',
                                 projects=projects,
+                                next_cursor=next_cursor,
+                                category_filter=category_filter,
+                                status_filter=status_filter,
+                                search_query=search_query,
                                 featured_projects=featured_projects_data,
                                 categories=categories,
                                 stats=stats,
@@ -2919,21 +3225,59 @@ def register_routes(app):
                                 user_role=session.get('user_role'),
                                 current_year=datetime.now().year)
 
+    def get_projects_page(category_filter, status_filter, search_query, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Get one page of projects (newest first) matching the list filters"""
+        # Base query
+        query = Project.query.options(joinedload(Project.category))
+
+        # Apply filters
+        if category_filter != 'all':
+            query = query.join(ProjectCategory).filter(ProjectCategory.name == category_filter)
+        
+        if status_filter != 'all':
+            query = query.filter(Project.status == status_filter)
+        
+        if search_query:
+            query = query.filter(Project.title.ilike(f'%{search_query}%'))
+        
+        return keyset_paginate(query, [Project.id], cursor=cursor, limit=limit)
+
+    @app.route('/api/projects')
+    @role_required(['super_admin', 'Group_Chief_accountant', 'portfolio_manager'])
+    def list_projects_api():
+        try:
+            projects, next_cursor = get_projects_page(
+                request.args.get('category', 'all'),
+                request.args.get('status', 'all'),
+                request.args.get('search', ''),
+                cursor=request.args.get('cursor'),
+                limit=get_page_size(request.args.get('limit'))
+            )
+            return jsonify({
+                'success': True,
+                'html': render_template('projects/_project_rows.html', projects=projects),
+                'next_cursor': next_cursor
+            })
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     # Add a new API endpoint for real-time data
     @app.route('/api/dashboard-data')
     @role_required(['super_admin', 'Group_Chief_accountant', 'portfolio_manager'])
     def dashboard_data():
         stats = get_project_stat()
         
-        # Get progress for all projects
+        # Get progress for all projects (only the columns we need)
         projects_progress = {}
-        for project in Project.query.all():
-            projects_progress[project.id] = {
-                'progress': project.progress
+        for project_id, progress in db.session.query(Project.id, Project.progress).all():
+            projects_progress[project_id] = {
+                'progress': progress
             }
         
         return jsonify({
-            'total_projects': len(Project.query.all()),
+            'total_projects': stats['total_projects'],
             'total_hours_used': stats['total_hours_used'],
             'total_hours_remaining': stats['total_hours_remaining'],
             'team_availability': stats['team_availability'],
@@ -2943,10 +3287,12 @@ def register_routes(app):
 
     # Enhance the get_project_stats function to include more data
     def get_project_stat():
-        # Your existing implementation plus:
-        total_projects = Project.query.count()
-        active_projects = Project.query.filter_by(status='Active').count()
-        high_priority_projects = Project.query.filter_by(priority='High').count()
+        # All counts and the budget sum come from one grouped query
+        project_statistics = get_project_statistics()
+        category_counts = project_statistics['category_counts']
+        total_projects = project_statistics['total_projects']
+        active_projects = project_statistics['status_counts'].get('Active', 0)
+        high_priority_projects = project_statistics['priority_counts'].get('High', 0)
         
         # Calculate hours data (you'll need to implement this based on your data model)
         total_hours_used = 1196  # Replace with actual calculation
@@ -2966,13 +3312,13 @@ def register_routes(app):
         team_members = 24
         
         return {
-            'investment_projects_count': Project.query.join(ProjectCategory).filter(ProjectCategory.name == 'Investment').count(),
-            'associate_projects_count': Project.query.join(ProjectCategory).filter(ProjectCategory.name == 'Associate').count(),
-            'subsidiary_projects_count': Project.query.join(ProjectCategory).filter(ProjectCategory.name == 'Subsidiary').count(),
-            'equity_projects_count': Project.query.join(ProjectCategory).filter(ProjectCategory.name == 'Equity').count(),
-            'maual_fund_projects_count': Project.query.join(ProjectCategory).filter(ProjectCategory.name == 'Mutual Fund').count(),
-            'join_ventaure_projects_count': Project.query.join(ProjectCategory).filter(ProjectCategory.name == 'Joint Venture').count(),
-            'total_budget': db.session.query(db.func.sum(Project.budget)).scalar() or 0,
+            'investment_projects_count': category_counts.get('Investment', 0),
+            'associate_projects_count': category_counts.get('Associate', 0),
+            'subsidiary_projects_count': category_counts.get('Subsidiary', 0),
+            'equity_projects_count': category_counts.get('Equity', 0),
+            'maual_fund_projects_count': category_counts.get('Mutual Fund', 0),
+            'join_ventaure_projects_count': category_counts.get('Joint Venture', 0),
+            'total_budget': project_statistics['total_budget'] or 0,
             'total_projects': total_projects,
             'active_projects_count': active_projects,
             'high_priority_count': high_priority_projects,
@@ -3045,6 +3391,7 @@ def register_routes(app):
             
             db.session.add(new_project)
             db.session.commit()
+            invalidate_project_statistics()
 
             # Log activity
             log_project_activity(
@@ -3116,6 +3463,7 @@ def register_routes(app):
             project.budget = float(budget) if budget and budget != '' else None
             
             db.session.commit()
+            invalidate_project_statistics()
 
             # Log activity - ADD THIS
             activity_description = f'Project "{old_title}" was updated'
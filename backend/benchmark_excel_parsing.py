@@ -0,0 +1,77 @@
+# backend/benchmark_excel_parsing.py
+import argparse
+import contextlib
+import io
+import math
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from upload_excel_data import ExcelToDBUploader
+
+DEFAULT_WORKBOOK = Path(__file__).parent.parent / 'RSR And Associates Data.xlsx'
+
+
+def same_records(left, right):
+    """Record lists are identical, treating NaN amounts as equal"""
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        if a.keys() != b.keys():
+            return False
+        for key in a:
+            x, y = a[key], b[key]
+            if isinstance(x, float) and isinstance(y, float) and math.isnan(x) and math.isnan(y):
+                continue
+            if x != y or type(x) is not type(y):
+                return False
+    return True
+
+
+def time_path(process, sheets, repeat):
+    """Best wall time over `repeat` runs of one parsing path across all sheets, and its output"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = {name: process(name, data) for name, data in sheets.items()}
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare row-by-row and vectorized associate sheet parsing')
+    parser.add_argument('workbook', nargs='?', default=str(DEFAULT_WORKBOOK), help='Associates workbook (.xlsx)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best time is reported')
+    parser.add_argument('--scale', type=int, default=1, help='Stack each sheet this many times to simulate longer histories')
+    args = parser.parse_args()
+
+    uploader = ExcelToDBUploader(db_config={})
+    sheets = {
+        name: data for name, data in pd.read_excel(args.workbook, sheet_name=None, engine='openpyxl').items()
+        if name in uploader.companies_mapping
+    }
+    if args.scale > 1:
+        sheets = {name: pd.concat([data] * args.scale, ignore_index=True) for name, data in sheets.items()}
+
+    rowwise_time, rowwise = time_path(uploader.process_sheet_data_rowwise, sheets, args.repeat)
+    vectorized_time, vectorized = time_path(uploader.process_sheet_data, sheets, args.repeat)
+
+    print(f"{'Sheet':<12} {'Records':>8} {'Identical':>10}")
+    identical = True
+    for name in sheets:
+        match = same_records(rowwise[name], vectorized[name])
+        identical &= match
+        print(f"{name:<12} {len(rowwise[name]):>8} {'yes' if match else 'NO':>10}")
+
+    print(f"\nRow-by-row: {rowwise_time * 1000:.1f} ms")
+    print(f"Vectorized: {vectorized_time * 1000:.1f} ms ({rowwise_time / vectorized_time:.1f}x)")
+
+    if not identical:
+        raise SystemExit("Vectorized output differs from the row-by-row path")
+
+
+if __name__ == "__main__":
+    main()
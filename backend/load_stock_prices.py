@@ -0,0 +1,26 @@
+# backend/load_stock_prices.py
+import sys
+import argparse
+from pathlib import Path
+
+# Add project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.app import create_app
+from backend.services.stock_history_service import StockHistoryService
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk load daily stock prices from CSV files')
+    parser.add_argument('paths', nargs='+', help='CSV files or directories of CSV files (ticker,date,price or <TICKER>.csv with date,price)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        result = StockHistoryService.load_price_files(args.paths)
+        print(f"Loaded {result['loaded']} prices from {result['files']} files")
+        if result['unknown_tickers']:
+            print(f"Skipped tickers not in the portfolio: {', '.join(result['unknown_tickers'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Add stock_daily_prices table
+
+Revision ID: 3f8a6c2e9b1d
+Revises: 9e4c1b7d2a6f
+Create Date: 2026-10-19 13:21:05.662814
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a6c2e9b1d'
+down_revision = '9e4c1b7d2a6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_daily_prices',
+    sa.Column('stock_id', sa.Integer(), nullable=False),
+    sa.Column('price_date', sa.Date(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.ForeignKeyConstraint(['stock_id'], ['stock_portfolio.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('stock_id', 'price_date')
+    )
+
+
+def downgrade():
+    op.drop_table('stock_daily_prices')
@@ -0,0 +1,26 @@
+"""Add start/end datetime index to calendar_events
+
+Revision ID: 7b2d4e9a1c3f
+Revises: 5c7a5e6e2c7b
+Create Date: 2026-10-19 10:12:41.204318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2d4e9a1c3f'
+down_revision = '5c7a5e6e2c7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('calendar_events', schema=None) as batch_op:
+        batch_op.create_index('idx_calendar_event_window', ['start_datetime', 'end_datetime'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('calendar_events', schema=None) as batch_op:
+        batch_op.drop_index('idx_calendar_event_window')
@@ -0,0 +1,40 @@
+"""Add notification_deliveries table
+
+Revision ID: 9e4c1b7d2a6f
+Revises: 7b2d4e9a1c3f
+Create Date: 2026-10-19 11:03:27.518940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4c1b7d2a6f'
+down_revision = '7b2d4e9a1c3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_deliveries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.Enum('email', 'whatsapp'), nullable=False),
+    sa.Column('recipient', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.Enum('sent', 'failed', 'optin_required'), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['calendar_events.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notification_deliveries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notification_deliveries_event_id'), ['event_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification_deliveries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notification_deliveries_event_id'))
+
+    op.drop_table('notification_deliveries')
@@ -0,0 +1,33 @@
+"""Add running position snapshot to stock_transactions
+
+Revision ID: c51e8d3a7f24
+Revises: 3f8a6c2e9b1d
+Create Date: 2026-10-19 14:47:52.130467
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c51e8d3a7f24'
+down_revision = '3f8a6c2e9b1d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows keep NULL snapshots; the first recalculation of a stock replays it in full
+    with op.batch_alter_table('stock_transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('position_shares', sa.Numeric(precision=18, scale=4), nullable=True))
+        batch_op.add_column(sa.Column('position_cost_basis', sa.Numeric(precision=18, scale=4), nullable=True))
+        batch_op.add_column(sa.Column('position_average_cost', sa.Numeric(precision=18, scale=4), nullable=True))
+        batch_op.create_index('idx_stock_txn_position', ['stock_id', 'transaction_date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_transactions', schema=None) as batch_op:
+        batch_op.drop_index('idx_stock_txn_position')
+        batch_op.drop_column('position_average_cost')
+        batch_op.drop_column('position_cost_basis')
+        batch_op.drop_column('position_shares')
@@ -0,0 +1,92 @@
+"""Add associate_financials fact table and copy the per-company associate tables into it
+
+Revision ID: d84f2b6e1a93
+Revises: c51e8d3a7f24
+Create Date: 2026-10-19 16:05:18.402731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd84f2b6e1a93'
+down_revision = 'c51e8d3a7f24'
+branch_labels = None
+depends_on = None
+
+# Company code -> legacy per-company table, as in ASSOCIATE_MODELS at the time of this migration
+LEGACY_TABLES = [
+    ('RSR', 'rsr_data'),
+    ('RTCC', 'rtcc_data'),
+    ('SMC', 'smc_data'),
+    ('SSEM', 'ssem_data'),
+    ('Razin', 'razin_data'),
+    ('Rafaya', 'rafaya_data'),
+    ('PPC', 'ppc_data'),
+    ('G.Chicken', 'g_chicken_data'),
+    ('Bayan', 'bayan_data'),
+    ('Abetong', 'abetong_data'),
+    ('Food Aroma', 'food_aroma'),
+    ('Impulse', 'impulse_data'),
+    ('Marooj', 'marooj_data'),
+]
+
+
+def upgrade():
+    op.create_table('associate_account_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('associate_financials',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('financial_year', sa.Integer(), nullable=False),
+    sa.Column('account_item_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.DECIMAL(precision=18, scale=2), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['account_item_id'], ['associate_account_items.id'], ),
+    sa.ForeignKeyConstraint(['company_id'], ['associate_companies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('company_id', 'financial_year', 'account_item_id', name='uq_associate_financial')
+    )
+    with op.batch_alter_table('associate_financials', schema=None) as batch_op:
+        batch_op.create_index('idx_associate_financial_item_year', ['account_item_id', 'financial_year'], unique=False)
+
+    # Every associate needs a company row to hang its facts off. Only missing codes are
+    # inserted, so re-running the upgrade never duplicates them (see downgrade)
+    for code, _ in LEGACY_TABLES:
+        op.execute(sa.text(
+            "INSERT INTO associate_companies (company_code, company_name, display_name, is_active, created_at, updated_at) "
+            "SELECT :code, :code, :code, 1, NOW(), NOW() FROM DUAL "
+            "WHERE NOT EXISTS (SELECT 1 FROM associate_companies WHERE company_code = :code)"
+        ).bindparams(code=code))
+
+    for code, table in LEGACY_TABLES:
+        op.execute(
+            f"INSERT IGNORE INTO associate_account_items (name, created_at) "
+            f"SELECT DISTINCT account_item, NOW() FROM {table}"
+        )
+        # Legacy tables had no unique key, so a repeated (year, item) keeps its last amount
+        op.execute(sa.text(
+            f"INSERT INTO associate_financials (company_id, financial_year, account_item_id, amount, created_at, updated_at) "
+            f"SELECT c.id, t.financial_year, i.id, t.amount, t.created_at, NOW() FROM {table} t "
+            f"JOIN associate_companies c ON c.company_code = :code "
+            f"JOIN associate_account_items i ON i.name = t.account_item "
+            f"ORDER BY t.id "
+            f"ON DUPLICATE KEY UPDATE associate_financials.amount = VALUES(amount)"
+        ).bindparams(code=code))
+
+
+def downgrade():
+    # The associate_companies rows seeded by upgrade() are left in place: they can't be told
+    # apart from rows that existed before, and upgrade() only adds codes that are missing
+    with op.batch_alter_table('associate_financials', schema=None) as batch_op:
+        batch_op.drop_index('idx_associate_financial_item_year')
+
+    op.drop_table('associate_financials')
+    op.drop_table('associate_account_items')
@@ -0,0 +1,52 @@
+"""Add associate_summaries snapshot table
+
+Revision ID: e27a9c4d5b16
+Revises: d84f2b6e1a93
+Create Date: 2026-10-19 16:41:03.915286
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27a9c4d5b16'
+down_revision = 'd84f2b6e1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('associate_summaries',
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('latest_year', sa.Integer(), nullable=False),
+    sa.Column('total_assets', sa.DECIMAL(precision=18, scale=2), nullable=True),
+    sa.Column('total_equity', sa.DECIMAL(precision=18, scale=2), nullable=True),
+    sa.Column('net_profit', sa.DECIMAL(precision=18, scale=2), nullable=True),
+    sa.Column('gross_profit', sa.DECIMAL(precision=18, scale=2), nullable=True),
+    sa.Column('data_version', sa.Integer(), nullable=False),
+    sa.Column('built_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['associate_companies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('company_id')
+    )
+
+    # First snapshot from the data already migrated into associate_financials
+    op.execute(
+        "INSERT INTO associate_summaries "
+        "(company_id, latest_year, total_assets, total_equity, net_profit, gross_profit, data_version, built_at) "
+        "SELECT f.company_id, f.financial_year, "
+        "MAX(CASE WHEN i.name = 'Total assets' THEN f.amount END), "
+        "MAX(CASE WHEN i.name = 'Total equity' THEN f.amount END), "
+        "MAX(CASE WHEN i.name = 'Profit & loss' THEN f.amount END), "
+        "MAX(CASE WHEN i.name = 'Gross (loss) / profit' THEN f.amount END), "
+        "1, NOW() "
+        "FROM associate_financials f "
+        "JOIN (SELECT company_id, MAX(financial_year) AS financial_year FROM associate_financials GROUP BY company_id) latest "
+        "ON latest.company_id = f.company_id AND latest.financial_year = f.financial_year "
+        "JOIN associate_account_items i ON i.id = f.account_item_id "
+        "GROUP BY f.company_id, f.financial_year"
+    )
+
+
+def downgrade():
+    op.drop_table('associate_summaries')
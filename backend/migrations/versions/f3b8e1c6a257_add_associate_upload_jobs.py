@@ -0,0 +1,48 @@
+"""Add associate_upload_jobs for workbook uploads from the admin page
+
+Revision ID: f3b8e1c6a257
+Revises: e27a9c4d5b16
+Create Date: 2026-10-20 10:12:47.308115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8e1c6a257'
+down_revision = 'e27a9c4d5b16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('associate_upload_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('uploaded_by', sa.String(length=100), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('message', sa.String(length=255), nullable=True),
+    sa.Column('sheets_total', sa.Integer(), nullable=True),
+    sa.Column('sheets_done', sa.Integer(), nullable=False),
+    sa.Column('current_sheet', sa.String(length=100), nullable=True),
+    sa.Column('inserted', sa.Integer(), nullable=True),
+    sa.Column('updated', sa.Integer(), nullable=True),
+    sa.Column('unchanged', sa.Integer(), nullable=True),
+    sa.Column('deleted', sa.Integer(), nullable=True),
+    sa.Column('data_version', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('associate_upload_jobs', schema=None) as batch_op:
+        batch_op.create_index('idx_associate_upload_status', ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('associate_upload_jobs', schema=None) as batch_op:
+        batch_op.drop_index('idx_associate_upload_status')
+
+    op.drop_table('associate_upload_jobs')
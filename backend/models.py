@@ -285,8 +285,32 @@ class CalendarEvent(db.Model):
     # Relationship to User
     organizer = db.relationship('User', backref=db.backref('calendar_events', lazy=True))
     
+    __table_args__ = (
+        db.Index('idx_calendar_event_window', 'start_datetime', 'end_datetime'),
+    )
+    
     def __repr__(self):
         return f'<CalendarEvent {self.title} - {self.start_datetime}>'
+
+
+class NotificationDelivery(db.Model):
+    __tablename__ = 'notification_deliveries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('calendar_events.id'), nullable=False, index=True)
+    channel = db.Column(db.Enum('email', 'whatsapp'), nullable=False)
+    recipient = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.Enum('sent', 'failed', 'optin_required'), nullable=False)
+    error = db.Column(db.Text)
+    reference = db.Column(db.String(100))  # Provider message id (e.g. Twilio SID)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    # Deliveries belong to the event and go away with it
+    event = db.relationship('CalendarEvent', backref=db.backref(
+        'notification_deliveries', lazy=True, cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f'<NotificationDelivery {self.channel} {self.recipient} - {self.status}>'
     
     
 class StockPortfolio(db.Model):
@@ -318,8 +342,17 @@ class StockPortfolio(db.Model):
     # FIXED: Remove the backref here since it's defined in StockYearStartPrice
     year_start_prices = db.relationship('StockYearStartPrice', back_populates='stock', lazy=True)
 
-    def update_values(self):
-        """Update calculated values including automatic YTD"""
+    def update_values(self, year_start_prices=None):
+        """
+        Update calculated values including automatic YTD.
+        `year_start_prices` ({year: price}) can be preloaded to avoid per-stock queries.
+        """
+        if self.update_market_values():
+            # AUTOMATIC YTD CALCULATION
+            self.calculate_ytd_values(year_start_prices)
+    
+    def update_market_values(self):
+        """Update current value and unrealized P&L; returns True when YTD needs recalculating"""
         if self.no_of_shares == 0:
             # When all shares are sold, reset values but keep transaction history
             self.current_value = 0
@@ -334,11 +367,10 @@ class StockPortfolio(db.Model):
                 self.unrealized_gain_loss_percent = (
                     self.unrealized_gain_loss / self.total_cost_basis * 100
                 )
-            
-            # AUTOMATIC YTD CALCULATION
-            self.calculate_ytd_values()
+            return True
+        return False
     
-    def calculate_ytd_values(self):
+    def calculate_ytd_values(self, year_start_prices=None):
         """Calculate YTD gains/losses based on transaction year"""
         current_year = datetime.now().year
         
@@ -353,7 +385,7 @@ class StockPortfolio(db.Model):
         
         if not current_year_transactions:
             # No transactions in current year - use year-start price
-            jan_1_price = self.get_january_first_price(current_year)
+            jan_1_price = self.get_january_first_price(current_year, year_start_prices)
             if jan_1_price and self.no_of_shares:
                 jan_1_value = self.no_of_shares * jan_1_price
                 self.unrealized_ytd_gain_loss = self.current_value - jan_1_value
@@ -395,8 +427,16 @@ class StockPortfolio(db.Model):
                 self.unrealized_ytd_gain_loss = 0
                 self.unrealized_ytd_gain_loss_percent = 0
     
-    def get_january_first_price(self, year):
+    def get_january_first_price(self, year, year_start_prices=None):
         """Get the price on January 1st of the given year"""
+        if year_start_prices is not None:
+            # Preloaded prices: same fallbacks as below without querying
+            if year in year_start_prices:
+                return year_start_prices[year]
+            if year_start_prices:
+                return year_start_prices[max(year_start_prices)]
+            return self.average_cost
+        
         # Check if we have a year-start price record
         year_start_price = StockYearStartPrice.query.filter_by(
             stock_id=self.id, year=year
@@ -428,7 +468,15 @@ class StockTransaction(db.Model):
     price_per_share = db.Column(db.Numeric(18, 4), nullable=False)
     total_amount = db.Column(db.Numeric(18, 4), nullable=False)
     notes = db.Column(db.Text)
+    # Running position after this transaction (ordered by transaction_date, id)
+    position_shares = db.Column(db.Numeric(18, 4))
+    position_cost_basis = db.Column(db.Numeric(18, 4))
+    position_average_cost = db.Column(db.Numeric(18, 4))
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    __table_args__ = (
+        db.Index('idx_stock_txn_position', 'stock_id', 'transaction_date', 'id'),
+    )
 
 class StockYearStartPrice(db.Model):
     """Tracks stock prices at the start of each year for YTD calculations"""
@@ -445,6 +493,14 @@ class StockYearStartPrice(db.Model):
     
     __table_args__ = (db.UniqueConstraint('stock_id', 'year', name='unique_stock_year'),)
 
+class StockDailyPrice(db.Model):
+    """Daily closing price history per stock, used for time-series valuation"""
+    __tablename__ = 'stock_daily_prices'
+    
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock_portfolio.id', ondelete='CASCADE'), primary_key=True)
+    price_date = db.Column(db.Date, primary_key=True)
+    price = db.Column(db.Numeric(18, 4), nullable=False)
+
 class SystemLog(db.Model):
     """Logs system-level actions like year-end price setting."""
     __tablename__ = 'system_logs'
@@ -943,4 +999,84 @@ ASSOCIATE_MODELS = {
     'Food Aroma': FoodAromaData,
     'Impulse': ImpulseData,
     'Marooj': MaroojData
-}
\ No newline at end of file
+}
+
+class AssociateAccountItem(db.Model):
+    """Dimension of financial statement line items shared by all associates"""
+    __tablename__ = 'associate_account_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<AssociateAccountItem {self.name}>'
+
+class AssociateFinancial(db.Model):
+    """One amount per associate, financial year and account item (replaces the per-company *_data tables)"""
+    __tablename__ = 'associate_financials'
+    
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('associate_companies.id', ondelete='CASCADE'), nullable=False)
+    financial_year = db.Column(db.Integer, nullable=False)
+    account_item_id = db.Column(db.Integer, db.ForeignKey('associate_account_items.id'), nullable=False)
+    amount = db.Column(db.DECIMAL(18, 2))
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    company = db.relationship('AssociateCompany', lazy=True)
+    account_item = db.relationship('AssociateAccountItem', lazy=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'financial_year', 'account_item_id', name='uq_associate_financial'),
+        db.Index('idx_associate_financial_item_year', 'account_item_id', 'financial_year'),
+    )
+    
+    def __repr__(self):
+        return f'<AssociateFinancial {self.company_id} {self.financial_year} {self.account_item_id}>'
+
+class AssociateSummary(db.Model):
+    """Latest-year headline figures per associate, rebuilt by the Excel uploader when it commits"""
+    __tablename__ = 'associate_summaries'
+    
+    company_id = db.Column(db.Integer, db.ForeignKey('associate_companies.id', ondelete='CASCADE'), primary_key=True)
+    latest_year = db.Column(db.Integer, nullable=False)
+    total_assets = db.Column(db.DECIMAL(18, 2))
+    total_equity = db.Column(db.DECIMAL(18, 2))
+    net_profit = db.Column(db.DECIMAL(18, 2))
+    gross_profit = db.Column(db.DECIMAL(18, 2))
+    data_version = db.Column(db.Integer, nullable=False)
+    built_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<AssociateSummary {self.company_id} {self.latest_year} v{self.data_version}>'
+
+
+class AssociateUploadJob(db.Model):
+    """Progress of a workbook uploaded through the admin page, shared by every app worker"""
+    __tablename__ = 'associate_upload_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    uploaded_by = db.Column(db.String(100))
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    message = db.Column(db.String(255))
+    sheets_total = db.Column(db.Integer)
+    sheets_done = db.Column(db.Integer, nullable=False, default=0)
+    current_sheet = db.Column(db.String(100))
+    inserted = db.Column(db.Integer)
+    updated = db.Column(db.Integer)
+    unchanged = db.Column(db.Integer)
+    deleted = db.Column(db.Integer)
+    data_version = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('idx_associate_upload_status', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<AssociateUploadJob {self.id} {self.status}>'
@@ -0,0 +1,176 @@
+# backend/services/associate_upload_service.py
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app as app
+from sqlalchemy import text
+from backend.extension import db
+from backend.models import AssociateUploadJob
+from backend.services.associates_service import AssociatesService
+
+# Jobs run on a local thread; their progress lives in associate_upload_jobs so any worker can report it
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='associate-upload')
+
+# MySQL named lock held by the running upload, so only one runs across all app workers.
+# It belongs to the job's connection, so MySQL releases it if the worker dies mid-upload.
+UPLOAD_LOCK = 'associates_upload'
+
+FINISHED_STATUSES = ('done', 'failed')
+
+# A job still queued this long after upload, with no upload running, lost its worker before starting
+QUEUED_TIMEOUT = timedelta(minutes=10)
+
+# Longest a progress stream stays open; clients can reconnect or poll the status endpoint
+PROGRESS_STREAM_TIMEOUT = timedelta(minutes=30)
+
+
+def upload_in_progress():
+    """Whether any worker is running an associates upload right now"""
+    return not db.session.execute(text("SELECT IS_FREE_LOCK(:name)"), {'name': UPLOAD_LOCK}).scalar()
+
+
+def start_associate_upload(path, filename, username=None):
+    """
+    Record and queue a saved workbook for upload, returning the job id. The file is deleted once
+    the job ends. Raises RuntimeError while another upload is running.
+    """
+    if upload_in_progress():
+        raise RuntimeError("Another associates upload is still in progress")
+
+    job = AssociateUploadJob(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        uploaded_by=username,
+        status='queued',
+        message='Waiting to start',
+        sheets_done=0,
+        created_at=datetime.now()
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _executor.submit(_run_in_app_context, app._get_current_object(), job.id, path)
+    return job.id
+
+
+def get_associate_upload(job_id):
+    """An upload job's progress as a dict, or None for unknown jobs"""
+    job = db.session.get(AssociateUploadJob, job_id)
+    if job is None:
+        return None
+
+    status, message, error = job.status, job.message, job.error
+    # A running job holds the lock until it has recorded its outcome; without it, its worker died
+    if status == 'running' and not upload_in_progress():
+        status, message, error = 'failed', 'Upload was interrupted, no data was changed', 'Upload worker stopped'
+    elif (status == 'queued' and job.created_at and datetime.now() - job.created_at > QUEUED_TIMEOUT
+            and not upload_in_progress()):
+        status, message, error = 'failed', 'Upload never started, no data was changed', 'Upload worker stopped'
+
+    return {
+        'id': job.id,
+        'filename': job.filename,
+        'uploaded_by': job.uploaded_by,
+        'status': status,
+        'message': message,
+        'sheets_total': job.sheets_total,
+        'sheets_done': job.sheets_done,
+        'current_sheet': job.current_sheet,
+        'counts': None if job.inserted is None else {
+            'inserted': job.inserted,
+            'updated': job.updated,
+            'unchanged': job.unchanged,
+            'deleted': job.deleted,
+        },
+        'data_version': job.data_version,
+        'error': error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _update(job_id, **changes):
+    db.session.query(AssociateUploadJob).filter_by(id=job_id).update(changes, synchronize_session=False)
+    db.session.commit()
+
+
+def _run_in_app_context(flask_app, job_id, path):
+    with flask_app.app_context():
+        try:
+            _run_upload(job_id, path)
+        except BaseException as e:
+            # Includes SystemExit and the like, so a job never stays queued or running
+            flask_app.logger.error(f"Associates upload {job_id} failed: {e!r}")
+            try:
+                db.session.rollback()
+                _update(job_id, status='failed', message='Upload failed, no data was changed',
+                        error=str(e) or e.__class__.__name__, finished_at=datetime.now())
+            except Exception as update_error:
+                flask_app.logger.error(f"Could not record failure of upload {job_id}: {str(update_error)}")
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            db.session.remove()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _run_upload(job_id, path):
+    """
+    Stream the workbook sheet by sheet into one transaction on a pooled connection, so readers
+    see either the old data or the new data, never a partial upload.
+    """
+    connection = db.engine.raw_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (UPLOAD_LOCK,))
+        if not cursor.fetchone()[0]:
+            raise RuntimeError("Another associates upload is still in progress")
+
+        try:
+            # pandas/openpyxl are only needed here, keep them out of app startup
+            from backend.upload_excel_data import ExcelToDBUploader
+
+            uploader = ExcelToDBUploader(db_config={})
+            uploader.connection = connection
+            sheet_names = uploader.mapped_sheet_names(path)
+            if not sheet_names:
+                raise ValueError("The workbook has no associate company sheets")
+            _update(job_id, status='running', message='Reading workbook', sheets_total=len(sheet_names))
+
+            counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+            sheets_done = 0
+            for sheet_name, sheet_data in uploader.iter_sheets(path):
+                if sheet_data is None:
+                    continue
+                _update(job_id, current_sheet=sheet_name, message=f"Processing {sheet_name}")
+
+                records = uploader.process_sheet_data(sheet_name, sheet_data)
+                for key, count in uploader.write_records(cursor, records).items():
+                    counts[key] += count
+                del sheet_data, records
+
+                sheets_done += 1
+                _update(job_id, sheets_done=sheets_done, **counts)
+
+            _update(job_id, current_sheet=None, message='Saving changes')
+            uploader.finish_upload(cursor, counts)
+
+            # A new data version leaves the metric catalogue cold; build it now rather than on the next page load
+            version = AssociatesService.get_data_version()
+            AssociatesService.get_metric_catalogue()
+
+            # Recorded before the lock is released, see get_associate_upload
+            _update(job_id, status='done', message='Upload complete', data_version=version,
+                    finished_at=datetime.now())
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("DO RELEASE_LOCK(%s)", (UPLOAD_LOCK,))
+    finally:
+        cursor.close()
+        connection.close()
@@ -2,8 +2,12 @@
 from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import and_, or_, desc, func
-from backend.models import ASSOCIATE_MODELS, AssociateCompany
+from backend.models import AssociateCompany, AssociateFinancial, AssociateAccountItem, AssociateSummary
 from backend.extension import db
+from backend.services.cache import cached
+
+# Catalogues are keyed by the upload data version, so the TTL only bounds memory for old versions
+METRIC_CATALOGUE_TTL = 3600
 
 class AssociatesService:
     # Financial statement categories
@@ -25,24 +29,48 @@ class AssociatesService:
     ]
     
     @staticmethod
-    def get_company_model(company_name):
-        """Get the appropriate model for a company"""
-        return ASSOCIATE_MODELS.get(company_name)
+    def financials_query():
+        """
+        Query over associate_financials with the legacy per-company row shape:
+        company_name (the company code), financial_year, account_item and amount
+        """
+        return db.session.query(
+            AssociateCompany.company_code.label('company_name'),
+            AssociateFinancial.financial_year,
+            AssociateAccountItem.name.label('account_item'),
+            AssociateFinancial.amount
+        ).join(
+            AssociateCompany, AssociateFinancial.company_id == AssociateCompany.id
+        ).join(
+            AssociateAccountItem, AssociateFinancial.account_item_id == AssociateAccountItem.id
+        )
+    
+    @staticmethod
+    def match_key(name):
+        """Key for matching fetched rows back to requested names the way MySQL compared them (case and trailing spaces ignored)"""
+        return name.rstrip().lower()
     
     @staticmethod
     def get_available_companies():
         """Get list of all available companies"""
-        return list(ASSOCIATE_MODELS.keys())
+        try:
+            codes = db.session.query(AssociateCompany.company_code).filter(
+                AssociateCompany.is_active == True
+            ).order_by(AssociateCompany.id).all()
+            return [code[0] for code in codes]
+        except Exception as e:
+            print(f"Error getting associate companies: {e}")
+            return []
     
     @staticmethod
     def get_company_years(company_name):
         """Get available years for a company"""
-        model = AssociatesService.get_company_model(company_name)
-        if not model:
-            return []
-        
         try:
-            years = db.session.query(model.financial_year).distinct().order_by(desc(model.financial_year)).all()
+            years = db.session.query(AssociateFinancial.financial_year).join(
+                AssociateCompany, AssociateFinancial.company_id == AssociateCompany.id
+            ).filter(
+                AssociateCompany.company_code == company_name
+            ).distinct().order_by(desc(AssociateFinancial.financial_year)).all()
             return [year[0] for year in years]
         except Exception as e:
             print(f"Error getting years for {company_name}: {e}")
@@ -54,25 +82,21 @@ class AssociatesService:
         Get financial data for a company
         item_type: 'balance_sheet', 'income_statement', 'ratios', or None for all
         """
-        model = AssociatesService.get_company_model(company_name)
-        if not model:
-            return {}
-        
         try:
-            query = db.session.query(model)
+            query = AssociatesService.financials_query().filter(AssociateCompany.company_code == company_name)
             
             if year:
-                query = query.filter(model.financial_year == year)
+                query = query.filter(AssociateFinancial.financial_year == year)
             
             # Filter by item type if specified
             if item_type == 'balance_sheet':
-                query = query.filter(model.account_item.in_(AssociatesService.BALANCE_SHEET_ITEMS))
+                query = query.filter(AssociateAccountItem.name.in_(AssociatesService.BALANCE_SHEET_ITEMS))
             elif item_type == 'income_statement':
-                query = query.filter(model.account_item.in_(AssociatesService.INCOME_STATEMENT_ITEMS))
+                query = query.filter(AssociateAccountItem.name.in_(AssociatesService.INCOME_STATEMENT_ITEMS))
             elif item_type == 'ratios':
-                query = query.filter(model.account_item.in_(AssociatesService.RATIO_ITEMS))
+                query = query.filter(AssociateAccountItem.name.in_(AssociatesService.RATIO_ITEMS))
             
-            data = query.order_by(model.account_item).all()
+            data = query.order_by(AssociateAccountItem.name).all()
             
             # Format the data
             formatted_data = {}
@@ -104,20 +128,16 @@ class AssociatesService:
     @staticmethod
     def get_multi_year_comparison(company_name, years=None, items=None):
         """Get comparison data across multiple years"""
-        model = AssociatesService.get_company_model(company_name)
-        if not model:
-            return {}
-        
         try:
-            query = db.session.query(model)
+            query = AssociatesService.financials_query().filter(AssociateCompany.company_code == company_name)
             
             if years:
-                query = query.filter(model.financial_year.in_(years))
+                query = query.filter(AssociateFinancial.financial_year.in_(years))
             
             if items:
-                query = query.filter(model.account_item.in_(items))
+                query = query.filter(AssociateAccountItem.name.in_(items))
             
-            data = query.order_by(model.financial_year, model.account_item).all()
+            data = query.order_by(AssociateFinancial.financial_year, AssociateAccountItem.name).all()
             
             # Organize by year then by item
             comparison_data = {}
@@ -134,43 +154,83 @@ class AssociatesService:
     @staticmethod
     def get_company_summary(company_name):
         """Get summary data for a company"""
-        model = AssociatesService.get_company_model(company_name)
-        if not model:
-            return {}
-        
         try:
             # Get latest year
-            latest_year = db.session.query(func.max(model.financial_year)).scalar()
+            latest_year = db.session.query(func.max(AssociateFinancial.financial_year)).join(
+                AssociateCompany, AssociateFinancial.company_id == AssociateCompany.id
+            ).filter(AssociateCompany.company_code == company_name).scalar()
             if not latest_year:
                 return {}
             
             # Get key metrics for latest year
             data = AssociatesService.get_financial_data(company_name, latest_year)
             
-            summary = {
-                'company_name': company_name,
-                'latest_year': latest_year,
-                'total_assets': data.get('Total assets', {}).get(latest_year, 0),
-                'total_equity': data.get('Total equity', {}).get(latest_year, 0),
-                'net_profit': data.get('Profit & loss', {}).get(latest_year, 0),
-                'gross_profit': data.get('Gross (loss) / profit', {}).get(latest_year, 0),
-            }
-            
-            # Calculate additional metrics
-            if summary['total_assets'] and summary['net_profit']:
-                summary['return_on_assets'] = (summary['net_profit'] / summary['total_assets']) * 100
-            
-            if summary['total_equity'] and summary['net_profit']:
-                summary['return_on_equity'] = (summary['net_profit'] / summary['total_equity']) 
-            
-            return summary
+            return AssociatesService.build_summary(
+                company_name,
+                latest_year,
+                data.get('Total assets', {}).get(latest_year, 0),
+                data.get('Total equity', {}).get(latest_year, 0),
+                data.get('Profit & loss', {}).get(latest_year, 0),
+                data.get('Gross (loss) / profit', {}).get(latest_year, 0)
+            )
         except Exception as e:
             print(f"Error getting summary for {company_name}: {e}")
             return {}
     
+    @staticmethod
+    def build_summary(company_name, latest_year, total_assets, total_equity, net_profit, gross_profit):
+        """Summary dict for a company's latest year, with the derived return ratios"""
+        summary = {
+            'company_name': company_name,
+            'latest_year': latest_year,
+            'total_assets': float(total_assets) if total_assets else 0,
+            'total_equity': float(total_equity) if total_equity else 0,
+            'net_profit': float(net_profit) if net_profit else 0,
+            'gross_profit': float(gross_profit) if gross_profit else 0,
+        }
+        
+        # Calculate additional metrics
+        if summary['total_assets'] and summary['net_profit']:
+            summary['return_on_assets'] = (summary['net_profit'] / summary['total_assets']) * 100
+        
+        if summary['total_equity'] and summary['net_profit']:
+            summary['return_on_equity'] = (summary['net_profit'] / summary['total_equity']) 
+        
+        return summary
+    
+    @staticmethod
+    def get_summary_snapshot():
+        """
+        Summaries for all companies from the associate_summaries snapshot in one read.
+        Returns (summaries, data_version); the version is None when no snapshot has been built.
+        """
+        rows = db.session.query(AssociateCompany.company_code, AssociateSummary).join(
+            AssociateSummary, AssociateSummary.company_id == AssociateCompany.id
+        ).filter(
+            AssociateCompany.is_active == True
+        ).order_by(AssociateCompany.id).all()
+        
+        summaries = {}
+        version = None
+        for company, snapshot in rows:
+            summaries[company] = AssociatesService.build_summary(
+                company, snapshot.latest_year, snapshot.total_assets, snapshot.total_equity,
+                snapshot.net_profit, snapshot.gross_profit
+            )
+            version = max(version or 0, snapshot.data_version)
+        
+        return summaries, version
+    
     @staticmethod
     def get_all_companies_summary():
-        """Get summary for all companies"""
+        """Get summary for all companies, from the upload-time snapshot when there is one"""
+        try:
+            summaries, version = AssociatesService.get_summary_snapshot()
+            if version is not None:
+                return summaries
+        except Exception as e:
+            print(f"Error reading associate summary snapshot: {e}")
+        
         summaries = {}
         for company in AssociatesService.get_available_companies():
             summary = AssociatesService.get_company_summary(company)
@@ -182,19 +242,16 @@ class AssociatesService:
     @staticmethod
     def search_financial_data(company_name, search_term, year=None):
         """Search financial data by account item name"""
-        model = AssociatesService.get_company_model(company_name)
-        if not model:
-            return []
-        
         try:
-            query = db.session.query(model).filter(
-                model.account_item.ilike(f'%{search_term}%')
+            query = AssociatesService.financials_query().filter(
+                AssociateCompany.company_code == company_name,
+                AssociateAccountItem.name.ilike(f'%{search_term}%')
             )
             
             if year:
-                query = query.filter(model.financial_year == year)
+                query = query.filter(AssociateFinancial.financial_year == year)
             
-            return query.order_by(model.financial_year, model.account_item).all()
+            return query.order_by(AssociateFinancial.financial_year, AssociateAccountItem.name).all()
         except Exception as e:
             print(f"Error searching data for {company_name}: {e}")
             return []
@@ -202,20 +259,17 @@ class AssociatesService:
     @staticmethod
     def get_yearly_trend(company_name, account_item, years_back=5):
         """Get trend data for a specific account item over years"""
-        model = AssociatesService.get_company_model(company_name)
-        if not model:
-            return {}
-        
         try:
             current_year = datetime.now().year
             start_year = current_year - years_back
             
-            data = db.session.query(
-                model.financial_year, model.amount
+            data = AssociatesService.financials_query().with_entities(
+                AssociateFinancial.financial_year, AssociateFinancial.amount
             ).filter(
-                model.account_item == account_item,
-                model.financial_year >= start_year
-            ).order_by(model.financial_year).all()
+                AssociateCompany.company_code == company_name,
+                AssociateAccountItem.name == account_item,
+                AssociateFinancial.financial_year >= start_year
+            ).order_by(AssociateFinancial.financial_year).all()
             
             trend_data = {year: float(amount) if amount else 0 for year, amount in data}
             return trend_data
@@ -234,13 +288,28 @@ class AssociatesService:
             'datasets': []
         }
         
-        # Get all available years
-        all_years = set()
-        for company in companies:
-            company_years = AssociatesService.get_company_years(company)
-            all_years.update([year for year in company_years if start_year <= year <= current_year])
+        # Years any of the companies reported within the window, in one query
+        years = db.session.query(AssociateFinancial.financial_year).join(
+            AssociateCompany, AssociateFinancial.company_id == AssociateCompany.id
+        ).filter(
+            AssociateCompany.company_code.in_(companies),
+            AssociateFinancial.financial_year.between(start_year, current_year)
+        ).distinct().all()
+        
+        trend_data['labels'] = sorted(year[0] for year in years)
         
-        trend_data['labels'] = sorted(list(all_years))
+        # Every requested (company, metric, year) cell in one query, pivoted in memory
+        cells = {}
+        if trend_data['labels']:
+            rows = AssociatesService.financials_query().filter(
+                AssociateCompany.company_code.in_(companies),
+                AssociateAccountItem.name.in_(metrics),
+                AssociateFinancial.financial_year.between(start_year, current_year)
+            ).all()
+            cells = {
+                (AssociatesService.match_key(row.company_name), AssociatesService.match_key(row.account_item), row.financial_year): row.amount
+                for row in rows
+            }
         
         # Define colors for companies
         company_colors = {
@@ -262,20 +331,11 @@ class AssociatesService:
         # Get data for each metric and company
         for metric in metrics:
             for company in companies:
-                model = AssociatesService.get_company_model(company)
-                if not model:
-                    continue
-                    
                 # Get data for this metric across years
                 data_points = []
                 for year in trend_data['labels']:
-                    record = db.session.query(model).filter(
-                        model.account_item == metric,
-                        model.financial_year == year
-                    ).first()
-                    
-                    value = float(record.amount) if record and record.amount else None
-                    data_points.append(value)
+                    amount = cells.get((AssociatesService.match_key(company), AssociatesService.match_key(metric), year))
+                    data_points.append(float(amount) if amount else None)
                 
                 # Only add dataset if we have data
                 if any(point is not None for point in data_points):
@@ -308,36 +368,66 @@ class AssociatesService:
             'metrics': {}
         }
         
+        # All requested companies' rows for the year in one query, then fill the grid in memory
+        rows = AssociatesService.financials_query().filter(
+            AssociateCompany.company_code.in_(companies),
+            AssociateAccountItem.name.in_(metrics),
+            AssociateFinancial.financial_year == year
+        ).all()
+        cells = {
+            (AssociatesService.match_key(row.company_name), AssociatesService.match_key(row.account_item)): row.amount
+            for row in rows
+        }
+        
         for metric in metrics:
             comparison_data['metrics'][metric] = {}
             for company in companies:
-                model = AssociatesService.get_company_model(company)
-                if not model:
-                    comparison_data['metrics'][metric][company] = None
-                    continue
-                    
-                record = db.session.query(model).filter(
-                    model.account_item == metric,
-                    model.financial_year == year
-                ).first()
-                
-                value = float(record.amount) if record and record.amount else None
-                comparison_data['metrics'][metric][company] = value
+                amount = cells.get((AssociatesService.match_key(company), AssociatesService.match_key(metric)))
+                comparison_data['metrics'][metric][company] = float(amount) if amount else None
         
         return comparison_data
 
+    @staticmethod
+    def get_data_version():
+        """Version stamped on the data by the last upload (None before the first snapshot)"""
+        return db.session.query(func.max(AssociateSummary.data_version)).scalar()
+    
+    @staticmethod
+    def get_metric_catalogue():
+        """
+        Every metric with the companies and years that report it, built once per uploaded
+        data version and then served from memory
+        """
+        return _build_metric_catalogue(AssociatesService.get_data_version())
+    
     @staticmethod
     def get_available_metrics():
         """Get all available financial metrics across companies"""
-        all_metrics = set()
-        
-        for company_name, model in ASSOCIATE_MODELS.items():
-            try:
-                metrics = db.session.query(model.account_item).distinct().all()
-                all_metrics.update([metric[0] for metric in metrics])
-                print(f"Company: {company_name}, Metrics count: {len(metrics)}")
-            except Exception as e:
-                print(f"Error getting metrics for {company_name}: {e}")
-                continue
-        
-        return sorted(list(all_metrics))
\ No newline at end of file
+        try:
+            return [metric['name'] for metric in AssociatesService.get_metric_catalogue()['metrics']]
+        except Exception as e:
+            print(f"Error getting available metrics: {e}")
+            return []
+
+
+@cached(METRIC_CATALOGUE_TTL, prefix='associate_metric_catalogue')
+def _build_metric_catalogue(version):
+    rows = db.session.query(
+        AssociateAccountItem.name, AssociateCompany.company_code, AssociateFinancial.financial_year
+    ).join(
+        AssociateFinancial, AssociateFinancial.account_item_id == AssociateAccountItem.id
+    ).join(
+        AssociateCompany, AssociateFinancial.company_id == AssociateCompany.id
+    ).distinct().all()
+    
+    catalogue = {}
+    for name, company, year in rows:
+        catalogue.setdefault(name, {}).setdefault(company, []).append(year)
+    
+    return {
+        'version': version,
+        'metrics': [{
+            'name': name,
+            'companies': {company: sorted(years) for company, years in sorted(companies.items())}
+        } for name, companies in sorted(catalogue.items())]
+    }
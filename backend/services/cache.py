@@ -0,0 +1,63 @@
+# backend/services/cache.py
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# Keys include caller-supplied arguments (fund ids, date ranges, ...), so the cache is
+# bounded: expired entries are purged and the least recently used go past this size
+MAX_ENTRIES = 512
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def cached(ttl, prefix=None):
+    """
+    Cache a function's return value in process memory for `ttl` seconds.
+    The cache key is the prefix (defaults to the function name) plus the call arguments.
+    """
+    def decorator(f):
+        key_prefix = prefix or f.__name__
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = (key_prefix, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            with _lock:
+                entry = _cache.get(key)
+                if entry and entry[0] > now:
+                    _cache.move_to_end(key)
+                    return entry[1]
+
+            value = f(*args, **kwargs)
+
+            with _lock:
+                _cache[key] = (now + ttl, value)
+                _cache.move_to_end(key)
+                if len(_cache) > MAX_ENTRIES:
+                    _evict(now)
+            return value
+
+        wrapper.invalidate = lambda: invalidate(key_prefix)
+        return wrapper
+    return decorator
+
+
+def _evict(now):
+    """Drop expired entries, then the least recently used until the cache fits. Caller holds the lock."""
+    for key in [k for k, (expires, _) in _cache.items() if expires <= now]:
+        del _cache[key]
+    while len(_cache) > MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+def invalidate(prefix):
+    """
+    Drop every cached entry stored under the given prefix.
+    Only reaches this worker process; other workers keep their entries until the TTL expires.
+    """
+    with _lock:
+        for key in [k for k in _cache if k[0] == prefix]:
+            del _cache[key]
@@ -0,0 +1,239 @@
+# backend/services/fund_performance_service.py
+from datetime import datetime
+import numpy as np
+from backend.models import MutualFund, MutualFundHolding, MutualFundTransaction, MutualFundNAV
+from backend.extension import db
+from backend.services.cache import cached
+from backend.services.stock_history_service import _forward_fill
+
+# Performance only moves with NAVs, holdings and transactions, all of which invalidate it
+FUND_PERFORMANCE_TTL = 600
+
+
+def get_fund_performance(as_of=None):
+    """
+    XIRR, time-weighted return and maximum drawdown (all in %) per holding, per category
+    and for the whole mutual fund book as of a date. Results are cached per as-of date.
+    """
+    return _fund_performance(as_of or datetime.now().date())
+
+
+def invalidate_fund_performance():
+    """Drop cached performance after NAVs, holdings or transactions change"""
+    _fund_performance.invalidate()
+
+
+@cached(FUND_PERFORMANCE_TTL, prefix='fund_performance')
+def _fund_performance(as_of):
+    holdings = db.session.query(
+        MutualFundHolding.id, MutualFundHolding.fund_id, MutualFundHolding.purchase_date,
+        MutualFundHolding.units, MutualFundHolding.purchase_value, MutualFundHolding.purchase_nav,
+        MutualFund.category
+    ).join(
+        MutualFund, MutualFundHolding.fund_id == MutualFund.id
+    ).filter(
+        MutualFundHolding.purchase_date <= as_of
+    ).order_by(MutualFundHolding.id).all()
+
+    result = {'as_of': as_of.strftime('%Y-%m-%d'), 'holdings': {}, 'categories': {}, 'book': _metrics(None, None, None)}
+    if not holdings:
+        return result
+
+    holding_ids = [h.id for h in holdings]
+    fund_ids = {h.fund_id for h in holdings}
+    start_date = min(h.purchase_date for h in holdings)
+
+    transactions = {}
+    for row in db.session.query(
+        MutualFundTransaction.holding_id, MutualFundTransaction.transaction_type,
+        MutualFundTransaction.transaction_date, MutualFundTransaction.units,
+        MutualFundTransaction.nav, MutualFundTransaction.amount
+    ).filter(
+        MutualFundTransaction.holding_id.in_(holding_ids)
+    ).order_by(MutualFundTransaction.transaction_date, MutualFundTransaction.id):
+        transactions.setdefault(row.holding_id, []).append(row)
+
+    navs = {}
+    for fund_id, nav_date, nav_value in db.session.query(
+        MutualFundNAV.fund_id, MutualFundNAV.nav_date, MutualFundNAV.nav_value
+    ).filter(
+        MutualFundNAV.fund_id.in_(fund_ids),
+        MutualFundNAV.nav_date.between(start_date, as_of)
+    ):
+        navs.setdefault(fund_id, []).append((nav_date, float(nav_value)))
+
+    # (holdings x days) grids of units held, price, money in and money out
+    n_holdings, n_days = len(holdings), (as_of - start_date).days + 1
+    units = np.full((n_holdings, n_days), np.nan)
+    prices = np.full((n_holdings, n_days), np.nan)
+    inflow = np.zeros((n_holdings, n_days))
+    outflow = np.zeros((n_holdings, n_days))
+    flows = []  # (day, amount) cash flows per holding, from the investor's side
+
+    for row, holding in enumerate(holdings):
+        txns = transactions.get(holding.id, [])
+        opening_units, opening_cost = _opening_lot(holding, txns)
+        day = (holding.purchase_date - start_date).days
+
+        held = opening_units
+        units[row, day] = held
+        prices[row, day] = opening_cost / opening_units if opening_units else float(holding.purchase_nav)
+        inflow[row, day] += opening_cost
+        holding_flows = [(day, -opening_cost)]
+
+        for txn in txns:
+            if txn.transaction_date > as_of or txn.transaction_date < holding.purchase_date:
+                continue
+            day = (txn.transaction_date - start_date).days
+            amount = float(txn.amount)
+            if txn.transaction_type == 'PURCHASE':
+                held += float(txn.units or 0)
+                inflow[row, day] += amount
+                holding_flows.append((day, -amount))
+            elif txn.transaction_type in ('REDEMPTION', 'DIVIDEND'):
+                if txn.transaction_type == 'REDEMPTION':
+                    held -= float(txn.units or 0)
+                outflow[row, day] += amount
+                holding_flows.append((day, amount))
+            else:
+                continue  # Switches do not change the holding (see add_mutual_fund_transaction)
+            units[row, day] = held
+            if txn.nav and np.isnan(prices[row, day]):
+                prices[row, day] = float(txn.nav)
+
+        # Published NAVs override purchase and transaction prices
+        for nav_date, nav_value in navs.get(holding.fund_id, []):
+            if nav_date >= holding.purchase_date:
+                prices[row, (nav_date - start_date).days] = nav_value
+
+        flows.append(holding_flows)
+
+    units = np.nan_to_num(_forward_fill(units))
+    prices = np.nan_to_num(_forward_fill(prices))
+    values = units * prices
+
+    # Terminal value of whatever is still held counts as a final inflow for XIRR
+    for row, holding_flows in enumerate(flows):
+        if values[row, -1] > 0:
+            holding_flows.append((n_days - 1, values[row, -1]))
+
+    # Every group (each holding, each category, the book) is a weighted sum of holdings
+    categories = sorted({h.category or 'Uncategorized' for h in holdings})
+    membership = np.zeros((n_holdings + len(categories) + 1, n_holdings))
+    membership[np.arange(n_holdings), np.arange(n_holdings)] = 1
+    for row, holding in enumerate(holdings):
+        membership[n_holdings + categories.index(holding.category or 'Uncategorized'), row] = 1
+    membership[-1] = 1
+
+    twr, drawdown = _time_weighted(membership @ values, membership @ inflow, membership @ outflow)
+
+    group_flows = list(flows)
+    for group in range(len(categories) + 1):
+        members = np.flatnonzero(membership[n_holdings + group])
+        group_flows.append([flow for member in members for flow in flows[member]])
+    xirr = _xirr(group_flows)
+
+    for row, holding in enumerate(holdings):
+        result['holdings'][holding.id] = _metrics(xirr[row], twr[row], drawdown[row])
+    for i, category in enumerate(categories):
+        group = n_holdings + i
+        result['categories'][category] = _metrics(xirr[group], twr[group], drawdown[group])
+    result['book'] = _metrics(xirr[-1], twr[-1], drawdown[-1])
+    return result
+
+
+def _opening_lot(holding, txns):
+    """
+    Units and cost of the original purchase, recovered by unwinding later transactions
+    from the holding's current units and purchase value.
+    """
+    units = float(holding.units)
+    cost = float(holding.purchase_value)
+    for txn in reversed(txns):
+        txn_units = float(txn.units or 0)
+        if txn.transaction_type == 'PURCHASE':
+            units -= txn_units
+            if cost is not None:
+                cost -= float(txn.amount)
+        elif txn.transaction_type == 'REDEMPTION':
+            # Redemptions remove cost pro rata; once fully redeemed the ratio is lost
+            if cost is not None:
+                cost = cost * (units + txn_units) / units if units > 0 else None
+            units += txn_units
+
+    if cost is None:
+        cost = units * float(holding.purchase_nav)
+    return units, cost
+
+
+def _time_weighted(values, inflow, outflow):
+    """
+    Cumulative time-weighted return and maximum drawdown of each row's daily value series.
+    Daily returns strip out that day's flows, so deposits and redemptions are not counted as performance.
+    """
+    previous = np.concatenate([np.zeros((values.shape[0], 1)), values[:, :-1]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(previous > 0, (values + outflow - inflow) / previous, 1.0)
+    index = np.cumprod(growth, axis=1)
+
+    twr = index[:, -1] - 1
+    drawdown = (index / np.maximum.accumulate(index, axis=1) - 1).min(axis=1)
+    return twr, drawdown
+
+
+def _xirr(flow_sets, iterations=100, tolerance=1e-10):
+    """
+    Annualised internal rate of return of many (day, amount) cash flow series at once.
+    Newton's method runs on all series together, bisection finishes any that did not converge.
+    Series without both an outflow and an inflow have no rate (NaN).
+    """
+    width = max((len(flows) for flows in flow_sets), default=0)
+    amounts = np.zeros((len(flow_sets), max(width, 1)))
+    years = np.zeros_like(amounts)
+    for i, flows in enumerate(flow_sets):
+        if flows:
+            days, cash = zip(*flows)
+            amounts[i, :len(flows)] = cash
+            years[i, :len(flows)] = (np.array(days) - min(days)) / 365.0
+
+    valid = (amounts < 0).any(axis=1) & (amounts > 0).any(axis=1)
+
+    def npv(rate):
+        with np.errstate(over='ignore', invalid='ignore'):
+            return (amounts * (1 + rate)[:, None] ** -years).sum(axis=1)
+
+    rate = np.full(len(flow_sets), 0.1)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(iterations):
+            discount = (1 + rate)[:, None] ** -years
+            value = (amounts * discount).sum(axis=1)
+            slope = (-years * amounts * discount / (1 + rate)[:, None]).sum(axis=1)
+            step = np.where(slope != 0, value / slope, 0)
+            rate = np.clip(rate - step, -0.9999, 1e6)
+            if np.all(np.abs(step[valid]) < tolerance):
+                break
+
+    unresolved = valid & ~(np.abs(npv(rate)) < 1e-6 * np.abs(amounts).sum(axis=1))
+    if unresolved.any():
+        low = np.full(len(flow_sets), -0.9999)
+        high = np.full(len(flow_sets), 100.0)
+        low_sign = np.sign(npv(low))
+        for _ in range(200):
+            mid = (low + high) / 2
+            same = np.sign(npv(mid)) == low_sign
+            low = np.where(same, mid, low)
+            high = np.where(same, high, mid)
+        bracketed = np.sign(npv(high)) != low_sign
+        rate = np.where(unresolved, np.where(bracketed, (low + high) / 2, np.nan), rate)
+
+    return np.where(valid, rate, np.nan)
+
+
+def _metrics(xirr, twr, drawdown):
+    def percent(value):
+        if value is None or np.isnan(value):
+            return None
+        return round(float(value) * 100, 2)
+
+    return {'xirr': percent(xirr), 'twr': percent(twr), 'max_drawdown': percent(drawdown)}
+
@@ -1,74 +1,136 @@
 # backend/services/mutual_fund_service.py
+import csv
+import io
 from datetime import datetime, timedelta
-from decimal import Decimal
-from sqlalchemy import func, and_, or_
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import func, and_, or_, case, literal, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from backend.models import MutualFund, MutualFundHolding, MutualFundTransaction, MutualFundNAV
 from backend.extension import db
+from backend.services.pagination import keyset_paginate, DEFAULT_PAGE_SIZE
+from backend.services.cache import cached
+from backend.services.fund_performance_service import get_fund_performance, invalidate_fund_performance
 
-def get_mutual_fund_holdings(start_date=None, end_date=None):
-    """
-    Get mutual fund holdings with performance data
-    """
-    if not end_date:
-        end_date = datetime.now().date()
-    if not start_date:
-        start_date = datetime(2020, 1, 1).date()
+# NAV series only change when NAVs are entered or imported, which invalidates them
+NAV_SERIES_TTL = 300
+NAV_SERIES_INTERVALS = ('daily', 'weekly', 'monthly', 'lttb')
+
+def _as_of_nav(end_date):
+    """Latest NAV on or before end_date per fund, ranked with ROW_NUMBER over the (fund_id, nav_date) index"""
+    ranked = db.session.query(
+        MutualFundNAV.fund_id,
+        MutualFundNAV.nav_date,
+        MutualFundNAV.nav_value,
+        func.row_number().over(
+            partition_by=MutualFundNAV.fund_id,
+            order_by=MutualFundNAV.nav_date.desc()
+        ).label('nav_rank')
+    ).filter(
+        MutualFundNAV.nav_date <= end_date
+    ).subquery()
     
-    # Query to get mutual fund holdings with current NAV
-    holdings_query = db.session.query(
+    return db.session.query(
+        ranked.c.fund_id, ranked.c.nav_date, ranked.c.nav_value
+    ).filter(ranked.c.nav_rank == 1).subquery()
+
+def _holdings_query(start_date, end_date):
+    """Query active holdings purchased in the date range with fund details and their as-of NAV"""
+    as_of_nav = _as_of_nav(end_date)
+    return db.session.query(
         MutualFundHolding,
         MutualFund.fund_name,
         MutualFund.fund_code,
-        MutualFund.category,  # Add category here
-        MutualFundNAV.nav_value.label('current_nav')
+        MutualFund.category,
+        as_of_nav.c.nav_value.label('current_nav')
     ).join(
         MutualFund, MutualFundHolding.fund_id == MutualFund.id
     ).outerjoin(
-        MutualFundNAV, and_(
-            MutualFundNAV.fund_id == MutualFund.id,
-            MutualFundNAV.nav_date == end_date
-        )
+        as_of_nav, as_of_nav.c.fund_id == MutualFund.id
     ).filter(
         MutualFundHolding.is_active == True,
         MutualFundHolding.purchase_date.between(start_date, end_date)
     )
+
+def _valued_holding(holding, fund_name, fund_code, fund_category, current_nav):
+    """
+    Value a holding at its as-of NAV without touching the ORM object.
+    Holdings with no NAV yet keep their stored valuation.
+    """
+    if current_nav:
+        current_value = holding.units * current_nav
+        unrealized_gain_loss = current_value - holding.purchase_value
+        unrealized_gain_loss_percent = (unrealized_gain_loss / holding.purchase_value * 100) if holding.purchase_value > 0 else 0
+    else:
+        current_value = holding.current_value
+        unrealized_gain_loss = holding.unrealized_gain_loss
+        unrealized_gain_loss_percent = holding.unrealized_gain_loss_percent
     
-    holdings_data = []
-    for holding, fund_name, fund_code, fund_category, current_nav in holdings_query.all():
-        # Calculate current values if we have current NAV
-        if current_nav:
-            current_value = holding.units * current_nav
-            unrealized_gain_loss = current_value - holding.purchase_value
-            unrealized_gain_loss_percent = (unrealized_gain_loss / holding.purchase_value * 100) if holding.purchase_value > 0 else 0
-            
-            # Update the holding with current values
-            holding.current_nav = current_nav
-            holding.current_value = current_value
-            holding.unrealized_gain_loss = unrealized_gain_loss
-            holding.unrealized_gain_loss_percent = unrealized_gain_loss_percent
-            
-            # Commit the updates
-            db.session.add(holding)
-        
-        holdings_data.append({
-            'holding': holding,
-            'fund_name': fund_name,
-            'fund_code': fund_code,
-            'fund_category': fund_category,  # Add category to the dict
-            'current_nav': current_nav
-        })
+    return {
+        'holding': holding,
+        'fund_name': fund_name,
+        'fund_code': fund_code,
+        'fund_category': fund_category,
+        'current_nav': current_nav or holding.current_nav,
+        'current_value': current_value,
+        'unrealized_gain_loss': unrealized_gain_loss,
+        'unrealized_gain_loss_percent': unrealized_gain_loss_percent
+    }
+
+def get_mutual_fund_holdings(start_date=None, end_date=None):
+    """
+    Get mutual fund holdings valued at each fund's latest NAV on or before end_date.
+    Read-only: valuations are computed per request and never written back.
+    """
+    if not end_date:
+        end_date = datetime.now().date()
+    if not start_date:
+        start_date = datetime(2020, 1, 1).date()
     
-    db.session.commit()
-    return holdings_data
+    return [_valued_holding(*row) for row in _holdings_query(start_date, end_date).all()]
+
+def get_mutual_fund_holdings_page(start_date=None, end_date=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Get one page of mutual fund holdings (newest purchases first) for lazy-loaded tables.
+    Returns the holdings in the same shape as get_mutual_fund_holdings plus the next cursor.
+    """
+    if not end_date:
+        end_date = datetime.now().date()
+    if not start_date:
+        start_date = datetime(2020, 1, 1).date()
+    
+    rows, next_cursor = keyset_paginate(
+        _holdings_query(start_date, end_date),
+        [MutualFundHolding.purchase_date, MutualFundHolding.id],
+        cursor=cursor,
+        limit=limit,
+        key=lambda row: [row[0].purchase_date, row[0].id]
+    )
+    
+    holdings_data = [_valued_holding(*row) for row in rows]
+    
+    return holdings_data, next_cursor
+
+def _as_of_date(end_date):
+    """Date used for cached return metrics; end_date may be a date or a YYYY-MM-DD string"""
+    if not end_date:
+        return datetime.now().date()
+    if isinstance(end_date, str):
+        return datetime.strptime(end_date, '%Y-%m-%d').date()
+    return end_date
 
 def get_mutual_fund_performance(start_date=None, end_date=None):
     """
-    Get performance summary of mutual fund investments
+    Get performance summary of mutual fund investments, with XIRR, time-weighted return
+    and maximum drawdown for each holding and for the whole book as of end_date
     """
     holdings_data = get_mutual_fund_holdings(start_date, end_date)
+    returns = get_fund_performance(_as_of_date(end_date))
+    
+    for h in holdings_data:
+        h['returns'] = returns['holdings'].get(h['holding'].id)
     
     total_investment = sum(float(h['holding'].purchase_value) for h in holdings_data)
-    total_current_value = sum(float(h['holding'].current_value or 0) for h in holdings_data)
+    total_current_value = sum(float(h['current_value'] or 0) for h in holdings_data)
     total_gain_loss = total_current_value - total_investment
     total_gain_loss_percent = (total_gain_loss / total_investment * 100) if total_investment > 0 else 0
     
@@ -78,7 +140,8 @@ def get_mutual_fund_performance(start_date=None, end_date=None):
         'total_current_value': total_current_value,
         'total_gain_loss': total_gain_loss,
         'total_gain_loss_percent': total_gain_loss_percent,
-        'count': len(holdings_data)
+        'count': len(holdings_data),
+        'returns': returns['book']
     }
 
 def update_mutual_fund_nav(fund_id, nav_date, nav_value, repurchase_price=None, sale_price=None):
@@ -106,25 +169,217 @@ def update_mutual_fund_nav(fund_id, nav_date, nav_value, repurchase_price=None,
         )
         db.session.add(nav_record)
     
-    # Update all active holdings for this fund
-    holdings = MutualFundHolding.query.filter_by(
+    # Update all active holdings for this fund in one statement
+    MutualFundHolding.query.filter_by(
         fund_id=fund_id,
         is_active=True
-    ).all()
-    
-    for holding in holdings:
-        holding.current_nav = nav_value
-        holding.current_value = holding.units * nav_value
-        holding.unrealized_gain_loss = holding.current_value - holding.purchase_value
-        if holding.purchase_value > 0:
-            holding.unrealized_gain_loss_percent = (
-                holding.unrealized_gain_loss / holding.purchase_value * 100
-            )
-        db.session.add(holding)
+    ).update(_holding_valuation(literal(nav_value)), synchronize_session=False)
     
     db.session.commit()
+    get_nav_series.invalidate()
+    invalidate_fund_performance()
     return nav_record
 
+def _holding_valuation(nav):
+    """SET clause revaluing holdings at `nav` (a column or bound value) in SQL"""
+    current_value = MutualFundHolding.units * nav
+    gain_loss = current_value - MutualFundHolding.purchase_value
+    return {
+        MutualFundHolding.current_nav: nav,
+        MutualFundHolding.current_value: current_value,
+        MutualFundHolding.unrealized_gain_loss: gain_loss,
+        MutualFundHolding.unrealized_gain_loss_percent: case(
+            (MutualFundHolding.purchase_value > 0, gain_loss / MutualFundHolding.purchase_value * 100),
+            else_=MutualFundHolding.unrealized_gain_loss_percent
+        )
+    }
+
+def parse_nav_file(text):
+    """Parse CSV text with fund_code,date,nav[,repurchase_price,sale_price] columns into NAV rows"""
+    rows = []
+    for line, row in enumerate(csv.DictReader(io.StringIO(text.strip())), start=2):
+        row = {str(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+        try:
+            rows.append({
+                'fund_code': row['fund_code'],
+                'nav_date': datetime.strptime(row.get('date') or row.get('nav_date'), '%Y-%m-%d').date(),
+                'nav_value': Decimal(row.get('nav') or row.get('nav_value')),
+                'repurchase_price': Decimal(row['repurchase_price']) if row.get('repurchase_price') else None,
+                'sale_price': Decimal(row['sale_price']) if row.get('sale_price') else None
+            })
+        except (KeyError, ValueError, TypeError, InvalidOperation):
+            raise ValueError(f"Line {line}: expected fund_code, date (YYYY-MM-DD) and nav")
+    
+    if not rows:
+        raise ValueError("No NAV rows provided")
+    return rows
+
+def import_mutual_fund_navs(rows, chunk_size=5000):
+    """
+    Bulk import NAV rows ({fund_code, nav_date, nav_value, ...}) in one transaction.
+    NAVs are upserted on fund_nav_date_uc, then each affected fund's holdings are revalued
+    at its latest stored NAV with a single multi-table UPDATE.
+    """
+    fund_codes = {row['fund_code'] for row in rows}
+    fund_ids = dict(db.session.query(MutualFund.fund_code, MutualFund.id).filter(
+        MutualFund.fund_code.in_(fund_codes)
+    ).all())
+    
+    values = [{
+        'fund_id': fund_ids[row['fund_code']],
+        'nav_date': row['nav_date'],
+        'nav_value': row['nav_value'],
+        'repurchase_price': row.get('repurchase_price'),
+        'sale_price': row.get('sale_price')
+    } for row in rows if row['fund_code'] in fund_ids]
+    
+    try:
+        table = MutualFundNAV.__table__
+        for i in range(0, len(values), chunk_size):
+            stmt = mysql_insert(table).values(values[i:i + chunk_size])
+            db.session.execute(stmt.on_duplicate_key_update(
+                nav_value=stmt.inserted.nav_value,
+                repurchase_price=func.coalesce(stmt.inserted.repurchase_price, table.c.repurchase_price),
+                sale_price=func.coalesce(stmt.inserted.sale_price, table.c.sale_price)
+            ))
+        
+        # Latest NAV per affected fund (which may predate this file for back-filled history)
+        affected = set(fund_ids.values())
+        latest_date = db.session.query(
+            MutualFundNAV.fund_id, func.max(MutualFundNAV.nav_date).label('nav_date')
+        ).filter(MutualFundNAV.fund_id.in_(affected)).group_by(MutualFundNAV.fund_id).subquery()
+        latest = db.session.query(MutualFundNAV.fund_id, MutualFundNAV.nav_value).join(
+            latest_date, and_(
+                MutualFundNAV.fund_id == latest_date.c.fund_id,
+                MutualFundNAV.nav_date == latest_date.c.nav_date
+            )
+        ).subquery()
+        
+        propagated = 0
+        if affected:
+            propagated = db.session.execute(
+                update(MutualFundHolding.__table__).where(
+                    MutualFundHolding.fund_id == latest.c.fund_id,
+                    MutualFundHolding.is_active == True
+                ).values({
+                    column.key: value for column, value in _holding_valuation(latest.c.nav_value).items()
+                })
+            ).rowcount
+        
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    get_nav_series.invalidate()
+    invalidate_fund_performance()
+    return {
+        'imported': len(values),
+        'funds_updated': len(affected),
+        'holdings_revalued': propagated,
+        'unknown_fund_codes': sorted(fund_codes - set(fund_ids))
+    }
+
+@cached(NAV_SERIES_TTL, prefix='nav_series')
+def get_nav_series(fund_ids, start_date=None, end_date=None, interval='daily', points=500):
+    """
+    NAV history for several funds between two dates in one range query.
+    `interval` is daily (raw NAVs), weekly/monthly (OHLC buckets) or lttb (at most `points`
+    NAVs picked with largest-triangle-three-buckets). `fund_ids` must be a tuple so calls cache.
+    """
+    if interval not in NAV_SERIES_INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(NAV_SERIES_INTERVALS)}")
+    if start_date and end_date and start_date > end_date:
+        raise ValueError("start_date must be before end_date")
+    
+    funds = db.session.query(MutualFund.id, MutualFund.fund_code, MutualFund.fund_name).filter(
+        MutualFund.id.in_(fund_ids)
+    ).all()
+    
+    # fund_id IN (...) plus a nav_date range is a range scan per fund on fund_nav_date_uc
+    query = db.session.query(MutualFundNAV.fund_id, MutualFundNAV.nav_date, MutualFundNAV.nav_value).filter(
+        MutualFundNAV.fund_id.in_(fund_ids)
+    )
+    if start_date:
+        query = query.filter(MutualFundNAV.nav_date >= start_date)
+    if end_date:
+        query = query.filter(MutualFundNAV.nav_date <= end_date)
+    
+    navs = {fund_id: [] for fund_id, _, _ in funds}
+    for fund_id, nav_date, nav_value in query.order_by(MutualFundNAV.fund_id, MutualFundNAV.nav_date):
+        navs[fund_id].append((nav_date, float(nav_value)))
+    
+    series = {}
+    for fund_id, fund_code, fund_name in funds:
+        rows = navs[fund_id]
+        if interval in ('weekly', 'monthly'):
+            data = _ohlc(rows, interval)
+        else:
+            if interval == 'lttb':
+                rows = _lttb(rows, points)
+            data = [{'date': nav_date.strftime('%Y-%m-%d'), 'nav': nav} for nav_date, nav in rows]
+        
+        series[fund_id] = {'fund_code': fund_code, 'fund_name': fund_name, 'points': data}
+    
+    return series
+
+def _ohlc(rows, interval):
+    """Bucket date-ordered (date, nav) rows into weekly (Monday) or monthly open/high/low/close"""
+    buckets = []
+    for nav_date, nav in rows:
+        if interval == 'weekly':
+            period = nav_date - timedelta(days=nav_date.weekday())
+        else:
+            period = nav_date.replace(day=1)
+        
+        if buckets and buckets[-1]['period'] == period:
+            bucket = buckets[-1]
+            bucket['high'] = max(bucket['high'], nav)
+            bucket['low'] = min(bucket['low'], nav)
+            bucket['close'] = nav
+            bucket['last_date'] = nav_date
+        else:
+            buckets.append({'period': period, 'open': nav, 'high': nav, 'low': nav, 'close': nav, 'last_date': nav_date})
+    
+    return [{
+        'date': bucket['period'].strftime('%Y-%m-%d'),
+        'last_date': bucket['last_date'].strftime('%Y-%m-%d'),
+        'open': bucket['open'],
+        'high': bucket['high'],
+        'low': bucket['low'],
+        'close': bucket['close']
+    } for bucket in buckets]
+
+def _lttb(rows, threshold):
+    """Largest-triangle-three-buckets downsampling of date-ordered (date, nav) rows"""
+    if threshold < 3 or len(rows) <= threshold:
+        return rows
+    
+    x = [nav_date.toordinal() for nav_date, _ in rows]
+    y = [nav for _, nav in rows]
+    every = (len(rows) - 2) / (threshold - 2)
+    
+    sampled = [rows[0]]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third point of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(rows))
+        avg_x = sum(x[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(y[next_start:next_end]) / (next_end - next_start)
+        
+        best, best_area = None, -1
+        for j in range(int(i * every) + 1, next_start):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        
+        sampled.append(rows[best])
+        a = best
+    
+    sampled.append(rows[-1])
+    return sampled
+
 def add_mutual_fund_transaction(holding_id, fund_id, transaction_type, transaction_date, 
                                units, nav, amount, description=None, reference_number=None, user_id=None):
     """
@@ -174,35 +429,59 @@ def add_mutual_fund_transaction(holding_id, fund_id, transaction_type, transacti
     
     db.session.add(holding)
     db.session.commit()
+    invalidate_fund_performance()
     
     return transaction
 
-def get_mutual_fund_summary_by_category(start_date=None, end_date=None):
+def _holdings_by_fund(start_date, end_date):
     """
-    Get mutual fund summary grouped by category with fund names
+    Count, cost, value and gain of the holdings in the date range per (category, fund), in one
+    aggregate query. Values follow _valued_holding: the as-of NAV when there is one, else the stored valuation.
     """
-    if not end_date:
-        end_date = datetime.now().date()
-    if not start_date:
-        start_date = datetime(2020, 1, 1).date()
+    as_of_nav = _as_of_nav(end_date)
+    has_nav = func.coalesce(as_of_nav.c.nav_value, 0) != 0
+    current_value = case(
+        (has_nav, MutualFundHolding.units * as_of_nav.c.nav_value),
+        else_=MutualFundHolding.current_value
+    )
+    gain_loss = case(
+        (has_nav, MutualFundHolding.units * as_of_nav.c.nav_value - MutualFundHolding.purchase_value),
+        else_=MutualFundHolding.unrealized_gain_loss
+    )
     
-    # Get all holdings with their fund information
-    holdings_query = db.session.query(
-        MutualFundHolding,
+    return db.session.query(
+        MutualFund.category,
         MutualFund.fund_name,
-        MutualFund.category
-    ).join(
+        func.count(MutualFundHolding.id).label('count'),
+        func.coalesce(func.sum(MutualFundHolding.purchase_value), 0).label('total_investment'),
+        func.coalesce(func.sum(current_value), 0).label('total_current_value'),
+        func.coalesce(func.sum(gain_loss), 0).label('total_gain_loss')
+    ).select_from(MutualFundHolding).join(
         MutualFund, MutualFundHolding.fund_id == MutualFund.id
+    ).outerjoin(
+        as_of_nav, as_of_nav.c.fund_id == MutualFund.id
     ).filter(
         MutualFundHolding.is_active == True,
         MutualFundHolding.purchase_date.between(start_date, end_date)
-    ).all()
+    ).group_by(MutualFund.category, MutualFund.fund_name).all()
+
+def get_mutual_fund_overview(start_date=None, end_date=None):
+    """
+    Header totals and the category summary for the mutual funds page, from one aggregate query
+    instead of loading and valuing every holding. Returns (totals, category_summary).
+    """
+    if not end_date:
+        end_date = datetime.now().date()
+    if not start_date:
+        start_date = datetime(2020, 1, 1).date()
+    
+    returns = get_fund_performance(_as_of_date(end_date))
     
     # Group by category and collect fund names
     category_data = {}
-    for holding, fund_name, category in holdings_query:
-        if category not in category_data:
-            category_data[category] = {
+    for row in _holdings_by_fund(start_date, end_date):
+        if row.category not in category_data:
+            category_data[row.category] = {
                 'fund_names': set(),
                 'count': 0,
                 'total_investment': Decimal('0.0'),
@@ -210,21 +489,12 @@ def get_mutual_fund_summary_by_category(start_date=None, end_date=None):
                 'total_gain_loss': Decimal('0.0')
             }
         
-        category_data[category]['fund_names'].add(fund_name)
-        category_data[category]['count'] += 1
-        category_data[category]['total_investment'] += holding.purchase_value
-        
-        # Convert current_value to Decimal if it's not None
-        current_value = holding.current_value or Decimal('0.0')
-        if isinstance(current_value, float):
-            current_value = Decimal(str(current_value))
-        category_data[category]['total_current_value'] += current_value
-        
-        # Convert unrealized_gain_loss to Decimal if it's not None
-        gain_loss = holding.unrealized_gain_loss or Decimal('0.0')
-        if isinstance(gain_loss, float):
-            gain_loss = Decimal(str(gain_loss))
-        category_data[category]['total_gain_loss'] += gain_loss
+        data = category_data[row.category]
+        data['fund_names'].add(row.fund_name)
+        data['count'] += row.count
+        data['total_investment'] += row.total_investment
+        data['total_current_value'] += row.total_current_value
+        data['total_gain_loss'] += row.total_gain_loss
     
     # Format the results
     summary = []
@@ -240,7 +510,26 @@ def get_mutual_fund_summary_by_category(start_date=None, end_date=None):
             'total_investment': total_investment,
             'total_current_value': total_current_value,
             'total_gain_loss': total_gain_loss,
-            'gain_loss_percent': (total_gain_loss / total_investment * 100) if total_investment else 0
+            'gain_loss_percent': (total_gain_loss / total_investment * 100) if total_investment else 0,
+            'returns': returns['categories'].get(category or 'Uncategorized')
         })
     
-    return summary
\ No newline at end of file
+    total_investment = sum(item['total_investment'] for item in summary)
+    total_current_value = sum(item['total_current_value'] for item in summary)
+    total_gain_loss = total_current_value - total_investment
+    totals = {
+        'total_investment': total_investment,
+        'total_current_value': total_current_value,
+        'total_gain_loss': total_gain_loss,
+        'total_gain_loss_percent': (total_gain_loss / total_investment * 100) if total_investment > 0 else 0,
+        'count': sum(item['count'] for item in summary),
+        'returns': returns['book']
+    }
+    
+    return totals, summary
+
+def get_mutual_fund_summary_by_category(start_date=None, end_date=None):
+    """
+    Get mutual fund summary grouped by category with fund names and return metrics
+    """
+    return get_mutual_fund_overview(start_date, end_date)[1]
\ No newline at end of file
@@ -0,0 +1,210 @@
+# backend/services/notification_service.py
+import json
+import smtplib
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from flask import current_app as app
+from backend.extension import db
+from backend.models import CalendarEvent, NotificationDelivery
+from backend.services.whattsapp_notification import send_whatsapp_notification
+
+# Notifications are I/O bound, a couple of threads keep up with them
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='notifications')
+
+
+def build_email_message(event, sender, recipients):
+    """Build the invitation email for a calendar event"""
+    # Create message
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ', '.join(recipients)
+    msg['Subject'] = event.email_subject or f"{event.title}"
+    
+    # Create email body
+    body = f"""
+     <!DOCTYPE html>
+        <html lang="en">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Event Invitation</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
+            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
+                <h1 style="color: white; margin: 0;">Event Invitation</h1>
+            </div>
+            
+            <div style="padding: 20px; border: 1px solid #ddd; border-top: none;">
+                <h2 style="color: #764ba2; margin-top: 0;">{event.title}</h2>
+                
+                <div style="background-color: #f9f9f9; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
+                    <p style="margin: 0;"><strong>Date & Time:</strong> {event.start_datetime.strftime('%A, %B %d, %Y at %I:%M %p')}</p>
+                    <p style="margin: 5px 0 0 0;"><strong>Duration:</strong> {(event.end_datetime - event.start_datetime).seconds // 3600} hours</p>
+                </div>
+                
+                <div style="margin-bottom: 20px;">
+                    <h3 style="color: #764ba2; margin-bottom: 10px;">Event Details</h3>
+                    <p><strong>Description:</strong> {event.description or 'No description provided'}</p>
+                    <p><strong>Location:</strong> {event.location or 'Not specified'}</p>
+                    <p><strong>Event Type:</strong> {event.event_type.title()}</p>
+                    <p><strong>Organizer:</strong> {event.organizer.username}</p>
+                </div>
+                
+                <div style="background-color: #f0f8ff; padding: 15px; border-radius: 5px; border-left: 4px solid #764ba2;">
+                    <h3 style="color: #764ba2; margin-top: 0;">Additional Message</h3>
+                    <p style="margin: 0;">{event.email_message or 'You are invited to this event. Please mark your calendar.'}</p>
+                </div>
+                
+                <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee;">
+                    <p style="font-size: 0.9em; color: #777;">
+                        This is an automated message. Please do not reply to this email.
+                    </p>
+                </div>
+            </div>
+        </body>
+    </html>
+    """
+
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+class SMTPEmailTransport:
+    """Send emails over one SMTP connection, opened once per batch"""
+
+    def __init__(self, server, port, username, password):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connection = None
+
+    def __enter__(self):
+        self.connection = smtplib.SMTP(self.server, self.port)
+        self.connection.starttls()
+        self.connection.login(self.username, self.password)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.connection.quit()
+        except smtplib.SMTPException:
+            pass
+        self.connection = None
+
+    def send(self, sender, recipients, message):
+        """Send a message and return the recipients the server refused"""
+        return self.connection.sendmail(sender, recipients, message.as_string())
+
+
+class FakeEmailTransport:
+    """Record emails in memory instead of sending them (offline testing)"""
+    outbox = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def send(self, sender, recipients, message):
+        self.outbox.append({'from': sender, 'to': list(recipients), 'message': message})
+        return {}
+
+
+def get_email_transport():
+    """Return the configured email transport, or None when email is not configured"""
+    if app.config.get('NOTIFICATION_TRANSPORT') == 'fake':
+        return FakeEmailTransport()
+
+    email_address = app.config.get('EMAIL_ADDRESS', '')
+    email_password = app.config.get('EMAIL_PASSWORD', '')
+    if not email_address or not email_password:
+        return None
+    return SMTPEmailTransport(
+        app.config.get('SMTP_SERVER', 'smtp.gmail.com'),
+        int(app.config.get('SMTP_PORT', 587)),
+        email_address,
+        email_password
+    )
+
+
+def send_calendar_notification(event, transport=None):
+    """
+    Send email notification for calendar event.
+    Returns one result dict (recipient, status, error, reference) per attendee.
+    """
+    # Parse attendees
+    attendee_emails = json.loads(event.attendees) if event.attendees else []
+    if not attendee_emails:
+        app.logger.warning("No attendees to send email to")
+        return []
+    
+    transport = transport or get_email_transport()
+    if transport is None:
+        app.logger.error("Email credentials not configured properly")
+        return [{'recipient': email, 'status': 'failed', 'error': 'Email not configured', 'reference': None}
+                for email in attendee_emails]
+    
+    app.logger.info(f"Recipients: {attendee_emails}")
+    app.logger.info(f"Event: {event.title}")
+    
+    sender = app.config.get('EMAIL_ADDRESS', '')
+    try:
+        with transport:
+            refused = transport.send(sender, attendee_emails, build_email_message(event, sender, attendee_emails))
+    except Exception as e:
+        app.logger.error(f"Failed to send email notification: {str(e)}")
+        return [{'recipient': email, 'status': 'failed', 'error': str(e), 'reference': None}
+                for email in attendee_emails]
+    
+    app.logger.info(f"Email notification sent for event: {event.title}")
+    return [{
+        'recipient': email,
+        'status': 'failed' if email in refused else 'sent',
+        'error': str(refused[email]) if email in refused else None,
+        'reference': None
+    } for email in attendee_emails]
+
+
+def deliver_event_notifications(event_id):
+    """Send the email and WhatsApp notifications requested for an event and record each delivery"""
+    event = CalendarEvent.query.get(event_id)
+    if event is None:
+        app.logger.warning(f"Calendar event {event_id} no longer exists, skipping notifications")
+        return 0
+    
+    deliveries = []
+    
+    # Send email if requested
+    if event.send_email and event.attendees:
+        for result in send_calendar_notification(event):
+            deliveries.append(NotificationDelivery(event_id=event.id, channel='email', **result))
+    
+    # Send WhatsApp if requested
+    if event.send_whatsapp and event.whatsapp_numbers:
+        phone_numbers = json.loads(event.whatsapp_numbers)
+        for result in send_whatsapp_notification(event, phone_numbers):
+            deliveries.append(NotificationDelivery(event_id=event.id, channel='whatsapp', **result))
+    
+    db.session.add_all(deliveries)
+    db.session.commit()
+    return len(deliveries)
+
+
+def _run_in_app_context(flask_app, event_id):
+    with flask_app.app_context():
+        try:
+            deliver_event_notifications(event_id)
+        except Exception as e:
+            db.session.rollback()
+            flask_app.logger.error(f"Error sending notifications for event {event_id}: {str(e)}")
+
+
+def dispatch_event_notifications(event):
+    """Queue an event's notifications on a local thread pool so the request does not wait on SMTP/Twilio"""
+    if not ((event.send_email and event.attendees) or (event.send_whatsapp and event.whatsapp_numbers)):
+        return
+    
+    _executor.submit(_run_in_app_context, app._get_current_object(), event.id)
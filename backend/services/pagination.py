@@ -0,0 +1,81 @@
+# backend/services/pagination.py
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+
+def get_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a requested page size, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row on a page as an opaque URL-safe cursor"""
+    payload = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor back into values matching the types of the sort columns"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("Invalid pagination cursor")
+
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = None
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            pass
+
+        if value is not None and python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif value is not None and python_type is date:
+            value = date.fromisoformat(value)
+        decoded.append(value)
+    return decoded
+
+
+def _after(columns, values, descending):
+    """Build the keyset predicate `(c1, c2, ...) < (v1, v2, ...)` (or > when ascending)"""
+    conditions = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        conditions.append(and_(*equal_prefix, beyond))
+    return or_(*conditions)
+
+
+def keyset_paginate(query, columns, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=True, key=None):
+    """
+    Return one page of `query` ordered by `columns` and the cursor for the next page.
+    The last column must be unique (normally the primary key) and none may be NULL.
+    `key` extracts the sort values from a row when rows are tuples rather than models.
+    """
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = key(last) if key else [getattr(last, column.key) for column in columns]
+        next_cursor = encode_cursor(values)
+
+    return rows, next_cursor
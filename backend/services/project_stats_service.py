@@ -0,0 +1,57 @@
+# backend/services/project_stats_service.py
+from decimal import Decimal
+from sqlalchemy import func
+from backend.models import Project, ProjectCategory
+from backend.extension import db
+from backend.services.cache import cached
+
+# Project stats are polled by the projects dashboard, a short TTL is enough
+PROJECT_STATS_TTL = 30
+
+
+@cached(PROJECT_STATS_TTL, prefix='project_statistics')
+def get_project_statistics():
+    """
+    Get project counts by category, status and priority plus the total budget
+    using a single grouped query
+    """
+    rows = db.session.query(
+        ProjectCategory.name,
+        Project.status,
+        Project.priority,
+        func.count(Project.id),
+        func.sum(Project.budget)
+    ).outerjoin(
+        ProjectCategory, Project.category_id == ProjectCategory.id
+    ).group_by(
+        ProjectCategory.name, Project.status, Project.priority
+    ).all()
+
+    category_counts = {}
+    status_counts = {}
+    priority_counts = {}
+    total_projects = 0
+    total_budget = Decimal('0')
+
+    for category_name, status, priority, count, budget in rows:
+        if category_name:
+            category_counts[category_name] = category_counts.get(category_name, 0) + count
+        if status:
+            status_counts[status] = status_counts.get(status, 0) + count
+        if priority:
+            priority_counts[priority] = priority_counts.get(priority, 0) + count
+        total_projects += count
+        total_budget += budget or 0
+
+    return {
+        'category_counts': category_counts,
+        'status_counts': status_counts,
+        'priority_counts': priority_counts,
+        'total_projects': total_projects,
+        'total_budget': total_budget
+    }
+
+
+def invalidate_project_statistics():
+    """Drop cached project stats after projects are created, edited or deleted"""
+    get_project_statistics.invalidate()
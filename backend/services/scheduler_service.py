@@ -0,0 +1,53 @@
+# backend/services/scheduler_service.py
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import text
+from backend.extension import db
+from backend.services.stock_service import StockService
+
+_scheduler = None
+
+
+def start_scheduler(app):
+    """
+    Start the in-process scheduler for stock maintenance jobs. Every app worker runs one, so each
+    job takes a MySQL named lock and is skipped by workers that find it taken. The jobs are
+    idempotent, so a late duplicate run is harmless.
+    """
+    global _scheduler
+    if _scheduler is not None or not app.config.get('SCHEDULER_ENABLED'):
+        return
+
+    _scheduler = BackgroundScheduler(daemon=True)
+    # Daily just after midnight, which also moves YTD figures onto the new year's base on Jan 1
+    _scheduler.add_job(
+        run_job, CronTrigger(hour=0, minute=5),
+        args=[app, 'refresh_stock_valuations', StockService.refresh_valuations],
+        id='refresh-stock-valuations', coalesce=True, max_instances=1, misfire_grace_time=3600
+    )
+    # Dec 31 closing prices become next year's year-start prices
+    _scheduler.add_job(
+        run_job, CronTrigger(month=12, day=31, hour=23, minute=50),
+        args=[app, 'stock_year_end_rollover', StockService.year_end_rollover],
+        id='stock-year-end-rollover', coalesce=True, max_instances=1, misfire_grace_time=600
+    )
+    _scheduler.start()
+
+
+def run_job(app, name, job):
+    """Run a scheduled job in an app context, unless another worker holds its lock"""
+    lock_name = f'scheduler_{name}'
+    with app.app_context():
+        with db.engine.connect() as connection:
+            if not connection.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': lock_name}).scalar():
+                app.logger.info(f"Scheduled job {name} skipped, another worker is running it")
+                return
+            try:
+                result = job()
+                app.logger.info(f"Scheduled job {name} completed: {result}")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Scheduled job {name} failed: {str(e)}")
+            finally:
+                connection.execute(text("DO RELEASE_LOCK(:name)"), {'name': lock_name})
+                db.session.remove()
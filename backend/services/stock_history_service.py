@@ -0,0 +1,197 @@
+# backend/services/stock_history_service.py
+import csv
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import numpy as np
+from sqlalchemy import func, and_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from backend.extension import db
+
+# Rows per INSERT ... ON DUPLICATE KEY UPDATE statement when loading price files
+PRICE_LOAD_CHUNK_SIZE = 5000
+
+
+class StockHistoryService:
+
+    @staticmethod
+    def read_price_csv(path):
+        """
+        Read a price file into (ticker, date, price) tuples.
+        Files have ticker,date,price columns, or just date,price when named after the ticker (e.g. 2222.csv).
+        """
+        default_ticker = os.path.splitext(os.path.basename(path))[0]
+        rows = []
+
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                row = {str(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+                try:
+                    price_date = datetime.strptime(row['date'], '%Y-%m-%d').date()
+                    price = Decimal(row.get('price') or row.get('close'))
+                except (KeyError, ValueError, TypeError, InvalidOperation):
+                    raise ValueError(f"{path} line {line}: expected date (YYYY-MM-DD) and price")
+                rows.append((row.get('ticker') or default_ticker, price_date, price))
+
+        return rows
+
+    @staticmethod
+    def load_daily_prices(rows):
+        """
+        Upsert (ticker, date, price) rows into stock_daily_prices in large batches.
+        Returns the number of rows loaded and the tickers that are not in the portfolio.
+        """
+        from backend.models import StockPortfolio, StockDailyPrice
+
+        tickers = {ticker for ticker, _, _ in rows}
+        stock_ids = dict(db.session.query(
+            StockPortfolio.ticker_symbol, StockPortfolio.id
+        ).filter(StockPortfolio.ticker_symbol.in_(tickers)).all())
+
+        values = [
+            {'stock_id': stock_ids[ticker], 'price_date': price_date, 'price': price}
+            for ticker, price_date, price in rows if ticker in stock_ids
+        ]
+
+        for i in range(0, len(values), PRICE_LOAD_CHUNK_SIZE):
+            stmt = mysql_insert(StockDailyPrice.__table__).values(values[i:i + PRICE_LOAD_CHUNK_SIZE])
+            db.session.execute(stmt.on_duplicate_key_update(price=stmt.inserted.price))
+
+        db.session.commit()
+        return {'loaded': len(values), 'unknown_tickers': sorted(tickers - set(stock_ids))}
+
+    @staticmethod
+    def load_price_files(paths):
+        """Load every CSV in the given files/directories"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(
+                    os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.csv')
+                ))
+            else:
+                files.append(path)
+
+        rows = []
+        for path in files:
+            rows.extend(StockHistoryService.read_price_csv(path))
+
+        result = StockHistoryService.load_daily_prices(rows)
+        result['files'] = len(files)
+        return result
+
+    @staticmethod
+    def get_valuation_series(start_date=None, end_date=None, max_points=None):
+        """
+        Daily position, cost basis and market value for every stock between two dates, in one pass.
+
+        Positions come from replaying each stock's transactions once (average cost method), prices
+        from stock_daily_prices with transaction prices as a fallback. Both are laid out on a
+        (stocks x days) grid and forward-filled with numpy, so the cost does not grow with the
+        number of stocks times days in Python. `max_points` evenly thins the returned days.
+        """
+        from backend.models import StockPortfolio, StockTransaction, StockDailyPrice
+
+        end_date = end_date or datetime.now().date()
+        if start_date is None:
+            start_date = db.session.query(func.min(StockTransaction.transaction_date)).scalar() or end_date
+        if start_date > end_date:
+            raise ValueError("start_date must be before end_date")
+
+        stocks = db.session.query(StockPortfolio.id, StockPortfolio.ticker_symbol).order_by(StockPortfolio.id).all()
+        dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date + timedelta(days=1), 'D'))
+        n_stocks, n_days = len(stocks), len(dates)
+        row_of = {stock_id: i for i, (stock_id, _) in enumerate(stocks)}
+
+        def day_index(d):
+            # Anything before the window is carried into its first day
+            return max((d - start_date).days, 0)
+
+        shares = np.full((n_stocks, n_days), np.nan)
+        cost = np.full((n_stocks, n_days), np.nan)
+        prices = np.full((n_stocks, n_days), np.nan)
+
+        # Replay transactions once, recording the position after each day's trades
+        transactions = db.session.query(
+            StockTransaction.stock_id, StockTransaction.transaction_date, StockTransaction.transaction_type,
+            StockTransaction.shares, StockTransaction.price_per_share, StockTransaction.total_amount
+        ).filter(
+            StockTransaction.transaction_date <= end_date
+        ).order_by(StockTransaction.stock_id, StockTransaction.transaction_date, StockTransaction.id).all()
+
+        position = {}
+        opening_date = {}  # Date of the price carried into the first day, per stock row
+        for stock_id, txn_date, txn_type, txn_shares, price, total_amount in transactions:
+            held, basis = position.get(stock_id, (Decimal('0'), Decimal('0')))
+            if txn_type == 'BUY':
+                held, basis = held + txn_shares, basis + total_amount
+            elif txn_type == 'SELL' and held > 0:
+                basis -= txn_shares * (basis / held)
+                held -= txn_shares
+            position[stock_id] = (held, basis)
+
+            row, col = row_of[stock_id], day_index(txn_date)
+            shares[row, col] = float(held)
+            cost[row, col] = float(basis)
+            if price:
+                prices[row, col] = float(price)
+                if col == 0:
+                    opening_date[row] = txn_date
+
+        # Daily closes override transaction prices; only the last close before the window is needed
+        last_before = db.session.query(
+            StockDailyPrice.stock_id, func.max(StockDailyPrice.price_date).label('price_date')
+        ).filter(StockDailyPrice.price_date < start_date).group_by(StockDailyPrice.stock_id).subquery()
+
+        opening = db.session.query(StockDailyPrice.stock_id, StockDailyPrice.price_date, StockDailyPrice.price).join(
+            last_before, and_(
+                StockDailyPrice.stock_id == last_before.c.stock_id,
+                StockDailyPrice.price_date == last_before.c.price_date
+            )
+        )
+        in_window = db.session.query(StockDailyPrice.stock_id, StockDailyPrice.price_date, StockDailyPrice.price).filter(
+            StockDailyPrice.price_date.between(start_date, end_date)
+        )
+        for stock_id, price_date, price in opening.union_all(in_window).all():
+            row = row_of.get(stock_id)
+            if row is None:
+                continue
+            if day_index(price_date) == 0 and price_date < opening_date.get(row, price_date):
+                continue  # A later transaction price already opens the window
+            prices[row, day_index(price_date)] = float(price)
+            if day_index(price_date) == 0:
+                opening_date[row] = price_date
+
+        shares = np.nan_to_num(_forward_fill(shares))
+        cost = np.nan_to_num(_forward_fill(cost))
+        prices = _forward_fill(prices)
+
+        # Without any price yet, value the position at cost
+        market_value = np.where(np.isnan(prices), cost, shares * np.nan_to_num(prices))
+
+        keep = np.arange(n_days)
+        if max_points and n_days > max_points:
+            keep = np.unique(np.append(np.linspace(0, n_days - 1, max_points).astype(int), n_days - 1))
+
+        total_value = market_value.sum(axis=0)[keep]
+        total_cost = cost.sum(axis=0)[keep]
+
+        return {
+            'dates': [str(d) for d in dates[keep]],
+            'market_value': np.round(total_value, 2).tolist(),
+            'cost_basis': np.round(total_cost, 2).tolist(),
+            'gain_loss': np.round(total_value - total_cost, 2).tolist(),
+            'stocks': {
+                ticker: np.round(market_value[i][keep], 2).tolist()
+                for i, (_, ticker) in enumerate(stocks)
+            }
+        }
+
+
+def _forward_fill(grid):
+    """Carry the last non-NaN value along each row"""
+    if grid.size == 0:
+        return grid
+    index = np.where(np.isnan(grid), 0, np.arange(grid.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return grid[np.arange(grid.shape[0])[:, None], index]
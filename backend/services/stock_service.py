@@ -1,4 +1,6 @@
-from decimal import Decimal
+import csv
+import io
+from decimal import Decimal, InvalidOperation
 from datetime import datetime
 from backend.extension import db
 
@@ -39,6 +41,7 @@ class StockService:
             total_amount=total_cost,
             notes="Initial purchase"
         )
+        StockService.set_position_snapshot(transaction, shares, total_cost)
         
         db.session.add(transaction)
         # Capture year-start price if it's Jan 1st or later in the current year
@@ -105,6 +108,7 @@ class StockService:
         )
         
         db.session.add(transaction)
+        StockService.snapshot_new_transaction(stock, transaction)
         return stock
     
     @staticmethod
@@ -141,6 +145,7 @@ class StockService:
         )
         
         db.session.add(transaction)
+        StockService.snapshot_new_transaction(stock, transaction)
         return stock, realized_gain_loss
     
     @staticmethod
@@ -164,31 +169,217 @@ class StockService:
                 notes="Market price update"
             )
             db.session.add(transaction)
+            StockService.snapshot_new_transaction(stock, transaction)
         
         return stock
     
+    @staticmethod
+    def parse_market_prices(payload, default_date=None):
+        """
+        Parse a market price batch into {ticker: (price, date)}.
+        `payload` is CSV text with ticker,price[,date] columns, a {ticker: price} dict,
+        or a list of {"ticker", "price", "date"} dicts. Dates default to `default_date`.
+        """
+        if isinstance(payload, str):
+            rows = list(csv.DictReader(io.StringIO(payload.strip())))
+        elif isinstance(payload, dict):
+            rows = [{'ticker': ticker, 'price': price} for ticker, price in payload.items()]
+        else:
+            rows = list(payload or [])
+        
+        prices = {}
+        for line, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                raise ValueError(f"Row {line}: expected an object with ticker and price")
+            row = {str(key or '').strip().lower(): value for key, value in row.items()}
+            # Tickers match case-insensitively in MySQL, so keep one spelling per ticker
+            ticker = str(row.get('ticker') or row.get('ticker_symbol') or '').strip().upper()
+            if not ticker:
+                raise ValueError(f"Row {line}: ticker is required")
+            try:
+                price = Decimal(str(row.get('price')).strip())
+            except (InvalidOperation, TypeError):
+                raise ValueError(f"Row {line}: invalid price for {ticker}")
+            if not price.is_finite():
+                raise ValueError(f"Row {line}: invalid price for {ticker}")
+            if price <= 0:
+                raise ValueError(f"Row {line}: price for {ticker} must be positive")
+            
+            price_date = row.get('date') or default_date
+            if isinstance(price_date, str):
+                try:
+                    price_date = datetime.strptime(price_date.strip(), '%Y-%m-%d').date()
+                except ValueError:
+                    raise ValueError(f"Row {line}: invalid date for {ticker}, expected YYYY-MM-DD")
+            prices[ticker] = (price, price_date)
+        
+        if not prices:
+            raise ValueError("No prices provided")
+        return prices
+    
+    @staticmethod
+    def bulk_update_market_prices(prices):
+        """
+        Mark many stocks to market at once from {ticker: (price, date)}.
+        Stocks are loaded with one IN query, revalued in memory and one UPDATE transaction per
+        dated price is bulk inserted. The caller commits, so the batch is a single transaction.
+        """
+        from backend.models import StockPortfolio, StockTransaction
+        
+        # The IN match follows the column's case-insensitive collation, so look prices up case-folded too
+        prices = {ticker.upper(): value for ticker, value in prices.items()}
+        stocks = StockPortfolio.query.filter(StockPortfolio.ticker_symbol.in_(list(prices))).all()
+        
+        positions = StockService.positions_as_of({
+            stock.id: prices[stock.ticker_symbol.upper()][1]
+            for stock in stocks if prices[stock.ticker_symbol.upper()][1]
+        })
+        
+        update_rows = []
+        for stock in stocks:
+            market_price, update_date = prices[stock.ticker_symbol.upper()]
+            stock.market_price = market_price
+            stock.update_market_values()
+            
+            if update_date:
+                # An UPDATE leaves the position as it stood on its date, which for a back-dated
+                # price is not the current one
+                shares, cost_basis = positions[stock.id]
+                update_rows.append({
+                    'stock_id': stock.id,
+                    'transaction_type': 'UPDATE',
+                    'transaction_date': update_date,
+                    'shares': 0,
+                    'price_per_share': market_price,
+                    'total_amount': 0,
+                    'notes': "Market price update",
+                    'position_shares': shares,
+                    'position_cost_basis': cost_basis,
+                    'position_average_cost': (
+                        None if shares is None else cost_basis / shares if shares > 0 else Decimal('0')
+                    )
+                })
+        
+        StockService.refresh_ytd_values(stocks)
+        
+        if update_rows:
+            db.session.bulk_insert_mappings(StockTransaction, update_rows)
+        
+        found = {stock.ticker_symbol.upper() for stock in stocks}
+        return {
+            'updated': len(stocks),
+            'unknown_tickers': sorted(ticker for ticker in prices if ticker not in found)
+        }
+    
+    @staticmethod
+    def positions_as_of(stock_dates):
+        """
+        Position (shares, cost basis) of each stock after its last transaction on or before the
+        given date, from {stock_id: date}. Stocks with no earlier trade hold nothing; a stock whose
+        last snapshot is missing gets (None, None), which makes a later replay start from scratch.
+        One ROW_NUMBER query runs per distinct date.
+        """
+        from backend.models import StockTransaction
+        from sqlalchemy import func
+        
+        positions = {stock_id: (Decimal('0'), Decimal('0')) for stock_id in stock_dates}
+        by_date = {}
+        for stock_id, as_of in stock_dates.items():
+            by_date.setdefault(as_of, []).append(stock_id)
+        
+        for as_of, stock_ids in by_date.items():
+            ranked = db.session.query(
+                StockTransaction.stock_id,
+                StockTransaction.position_shares,
+                StockTransaction.position_cost_basis,
+                func.row_number().over(
+                    partition_by=StockTransaction.stock_id,
+                    order_by=(StockTransaction.transaction_date.desc(), StockTransaction.id.desc())
+                ).label('txn_rank')
+            ).filter(
+                StockTransaction.stock_id.in_(stock_ids),
+                StockTransaction.transaction_date <= as_of
+            ).subquery()
+            
+            for stock_id, shares, cost_basis in db.session.query(
+                ranked.c.stock_id, ranked.c.position_shares, ranked.c.position_cost_basis
+            ).filter(ranked.c.txn_rank == 1):
+                positions[stock_id] = (shares, cost_basis) if shares is not None and cost_basis is not None else (None, None)
+        
+        return positions
+    
+    @staticmethod
+    def rollover_year_start_prices(year, recorded_date=None, only_held=False, fallback_to_cost=False):
+        """
+        Record `year`'s start price for every stock with one INSERT ... SELECT.
+        Prices already recorded for that year are kept (the duplicate key update is a no-op),
+        so this is idempotent and safe to re-run. Returns the number of stocks that had no
+        price for the year yet, i.e. the rows actually added.
+        """
+        from backend.models import StockPortfolio, StockYearStartPrice
+        from sqlalchemy import func, literal, select
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        
+        recorded_date = recorded_date or datetime.now().date()
+        price = StockPortfolio.market_price
+        if fallback_to_cost:
+            price = func.coalesce(func.nullif(StockPortfolio.market_price, 0), StockPortfolio.average_cost)
+        
+        source = select(
+            StockPortfolio.id, literal(year), price, literal(recorded_date)
+        ).where(price.isnot(None), price != 0)
+        if only_held:
+            source = source.where(StockPortfolio.no_of_shares > 0)
+        
+        table = StockYearStartPrice.__table__
+        
+        # rowcount can't tell inserts from kept duplicates: the MySQL dialects connect with
+        # CLIENT_FOUND_ROWS, which counts matched duplicates too. Count the missing years first.
+        missing = db.session.execute(
+            select(func.count()).select_from(
+                source.where(~select(table.c.stock_id).where(
+                    table.c.stock_id == StockPortfolio.id, table.c.year == year
+                ).exists()).subquery()
+            )
+        ).scalar()
+        
+        stmt = mysql_insert(table).from_select(
+            ['stock_id', 'year', 'price', 'recorded_date'], source
+        ).on_duplicate_key_update(price=table.c.price)
+        db.session.execute(stmt)
+        return missing
+    
     @staticmethod
     def set_year_end_prices(year_end_date):
         """Set year-end prices and reset YTD calculations"""
         from backend.models import StockPortfolio
         
-        stocks = StockPortfolio.query.all()
-        
-        for stock in stocks:
-            if stock.market_price:
-                stock.price_at_last_year_end = stock.market_price
-                stock.value_at_last_year_end = stock.no_of_shares * stock.market_price
-                stock.unrealized_ytd_gain_loss = 0
-                stock.unrealized_ytd_gain_loss_percent = 0
+        updated = StockPortfolio.query.filter(
+            StockPortfolio.market_price.isnot(None), StockPortfolio.market_price != 0
+        ).update({
+            StockPortfolio.price_at_last_year_end: StockPortfolio.market_price,
+            StockPortfolio.value_at_last_year_end: StockPortfolio.no_of_shares * StockPortfolio.market_price,
+            StockPortfolio.unrealized_ytd_gain_loss: 0,
+            StockPortfolio.unrealized_ytd_gain_loss_percent: 0
+        }, synchronize_session=False)
         
         db.session.commit()
-        return len(stocks)
+        return updated
+    
+    @staticmethod
+    def year_end_rollover(year=None):
+        """
+        Scheduled year-end task: capture closing prices as next year's start prices and
+        as last year-end values, in one transaction with a fixed number of statements.
+        """
+        year = year or datetime.now().year
+        captured = StockService.rollover_year_start_prices(year + 1)
+        StockService.set_year_end_prices(datetime(year, 12, 31).date())
+        return captured
     
     @staticmethod
     def capture_year_start_prices():
         """Automatically capture Jan 1st prices for all stocks - improved version"""
-        from backend.models import StockPortfolio, StockYearStartPrice
-        
         current_year = datetime.now().year
         current_date = datetime.now().date()
         
@@ -197,31 +388,135 @@ class StockService:
         jan_7_date = datetime(current_year, 1, 7).date()
         
         if jan_1_date <= current_date <= jan_7_date:
-            stocks = StockPortfolio.query.all()
-            captured_count = 0
-            
-            for stock in stocks:
-                # Check if we already have this year's price
-                existing = StockYearStartPrice.query.filter_by(
-                    stock_id=stock.id, year=current_year
-                ).first()
-                
-                if not existing and stock.market_price and stock.no_of_shares > 0:
-                    # Capture the current market price as year-start price
-                    year_start_price = StockYearStartPrice(
-                        stock_id=stock.id,
-                        year=current_year,
-                        price=stock.market_price,
-                        recorded_date=current_date
-                    )
-                    db.session.add(year_start_price)
-                    captured_count += 1
-            
+            captured_count = StockService.rollover_year_start_prices(current_year, current_date, only_held=True)
             db.session.commit()
             return f"Year-start prices captured for {captured_count} stocks"
         
         return "Not within first week of January - year-start prices not captured"
     
+    @staticmethod
+    def load_year_start_prices(stock_ids=None):
+        """Load year-start prices for all (or the given) stocks in one query as {stock_id: {year: price}}"""
+        from backend.models import StockYearStartPrice
+        
+        query = db.session.query(
+            StockYearStartPrice.stock_id, StockYearStartPrice.year, StockYearStartPrice.price
+        )
+        if stock_ids is not None:
+            query = query.filter(StockYearStartPrice.stock_id.in_(stock_ids))
+        
+        prices = {}
+        for stock_id, year, price in query.all():
+            prices.setdefault(stock_id, {})[year] = price
+        return prices
+    
+    @staticmethod
+    def refresh_valuations():
+        """
+        Recompute current value, P&L and YTD for every stock and fill in missing
+        current-year year-start prices. Run by the scheduler so page views stay read-only.
+        """
+        from backend.models import StockPortfolio
+        
+        # Create current year price records if missing (current price as fallback)
+        StockService.rollover_year_start_prices(datetime.now().year, only_held=True)
+        
+        stocks = StockPortfolio.query.all()
+        year_start_prices = StockService.load_year_start_prices()
+        
+        for stock in stocks:
+            stock.update_market_values()
+        
+        StockService.refresh_ytd_values(stocks, year_start_prices)
+        db.session.commit()
+        return len(stocks)
+    
+    @staticmethod
+    def compute_ytd_values(stocks, year_start_prices=None, year=None):
+        """
+        Portfolio-level YTD engine: compute {stock_id: (ytd_gain_loss, ytd_gain_loss_percent)} for
+        many stocks using one query for the year's transactions and one for year-start prices
+        (skipped when `year_start_prices` is passed). Mirrors StockPortfolio.calculate_ytd_values.
+        """
+        from backend.models import StockTransaction
+        
+        year = year or datetime.now().year
+        stock_ids = [stock.id for stock in stocks]
+        if not stock_ids:
+            return {}
+        if year_start_prices is None:
+            year_start_prices = StockService.load_year_start_prices(stock_ids)
+        
+        # Net YTD shares and cost per stock, walking the year's trades in order
+        ytd_positions = {}
+        for stock_id, transaction_type, shares, total_amount in db.session.query(
+            StockTransaction.stock_id, StockTransaction.transaction_type,
+            StockTransaction.shares, StockTransaction.total_amount
+        ).filter(
+            StockTransaction.stock_id.in_(stock_ids),
+            StockTransaction.transaction_date.between(datetime(year, 1, 1).date(), datetime(year, 12, 31).date())
+        ).order_by(StockTransaction.stock_id, StockTransaction.transaction_date, StockTransaction.id):
+            ytd_investment, ytd_shares = ytd_positions.get(stock_id, (Decimal('0'), Decimal('0')))
+            if transaction_type == 'BUY':
+                ytd_investment += total_amount
+                ytd_shares += shares
+            elif transaction_type == 'SELL':
+                # For sells, calculate cost basis of sold shares
+                avg_cost_ytd = ytd_investment / ytd_shares if ytd_shares > 0 else 0
+                ytd_investment -= shares * avg_cost_ytd
+                ytd_shares -= shares
+            ytd_positions[stock_id] = (ytd_investment, ytd_shares)
+        
+        results = {}
+        for stock in stocks:
+            if not stock.no_of_shares or not stock.current_value:
+                results[stock.id] = (0, 0)
+                continue
+            
+            if stock.id not in ytd_positions:
+                # No transactions in current year - use year-start price
+                jan_1_price = stock.get_january_first_price(year, year_start_prices.get(stock.id, {}))
+                if jan_1_price:
+                    jan_1_value = stock.no_of_shares * jan_1_price
+                    gain = stock.current_value - jan_1_value
+                    results[stock.id] = (gain, gain / jan_1_value * 100 if jan_1_value > 0 else 0)
+                else:
+                    results[stock.id] = (0, 0)
+            else:
+                # Calculate YTD based on current year transactions
+                ytd_investment, ytd_shares = ytd_positions[stock.id]
+                if ytd_shares > 0:
+                    gain = ytd_shares * stock.market_price - ytd_investment
+                    results[stock.id] = (gain, gain / ytd_investment * 100 if ytd_investment > 0 else 0)
+                else:
+                    results[stock.id] = (0, 0)
+        
+        return results
+    
+    @staticmethod
+    def refresh_ytd_values(stocks, year_start_prices=None):
+        """Compute YTD for the given stocks with the portfolio engine and write it back in one bulk UPDATE"""
+        from backend.models import StockPortfolio
+        from sqlalchemy.orm.attributes import set_committed_value
+        
+        # Only stocks with a price and shares get YTD, as in StockPortfolio.update_values
+        stocks = [stock for stock in stocks if stock.market_price and stock.no_of_shares]
+        results = StockService.compute_ytd_values(stocks, year_start_prices)
+        
+        db.session.bulk_update_mappings(StockPortfolio, [{
+            'id': stock_id,
+            'unrealized_ytd_gain_loss': gain,
+            'unrealized_ytd_gain_loss_percent': percent
+        } for stock_id, (gain, percent) in results.items()])
+        
+        # Keep the loaded objects in step without marking them dirty again
+        for stock in stocks:
+            gain, percent = results[stock.id]
+            set_committed_value(stock, 'unrealized_ytd_gain_loss', gain)
+            set_committed_value(stock, 'unrealized_ytd_gain_loss_percent', percent)
+        
+        return len(results)
+    
     @staticmethod
     def get_current_ytd_price(stock_id):
         """Get the YTD baseline price for a stock"""
@@ -245,60 +540,98 @@ class StockService:
     @staticmethod
     def initialize_year_start_prices():
         """Initialize year-start prices for all existing stocks (run this once)"""
-        from backend.models import StockPortfolio, StockYearStartPrice
-        
         current_year = datetime.now().year
-        stocks = StockPortfolio.query.all()
-        count = 0
         
-        for stock in stocks:
-            # Check if year-start price exists
-            existing = StockYearStartPrice.query.filter_by(
-                stock_id=stock.id, year=current_year
-            ).first()
-            
-            if not existing:
-                # Use current market price or average cost as fallback
-                ytd_price = stock.market_price if stock.market_price else stock.average_cost
-                
-                year_start_price = StockYearStartPrice(
-                    stock_id=stock.id,
-                    year=current_year,
-                    price=ytd_price,
-                    recorded_date=datetime.now().date()
-                )
-                db.session.add(year_start_price)
-                count += 1
+        # Use current market price or average cost as fallback
+        count = StockService.rollover_year_start_prices(current_year, fallback_to_cost=True)
         
         db.session.commit()
         return f"Year-start prices initialized for {count} stocks"
     
     @staticmethod
-    def recalculate_stock_from_transactions(stock_id):
-        """Recalculate stock portfolio from all transactions"""
+    def apply_transaction(total_shares, total_investment, transaction):
+        """Return the (shares, cost basis) position after applying one transaction"""
+        if transaction.transaction_type == 'BUY':
+            total_shares += transaction.shares
+            total_investment += transaction.total_amount
+        elif transaction.transaction_type == 'SELL':
+            if total_shares > 0:
+                # Calculate average cost before sell
+                avg_cost = total_investment / total_shares if total_shares > 0 else Decimal('0')
+                cost_of_sold = transaction.shares * avg_cost
+                total_shares -= transaction.shares
+                total_investment -= cost_of_sold
+        return total_shares, total_investment
+    
+    @staticmethod
+    def set_position_snapshot(transaction, total_shares, total_investment):
+        """Store the running position after a transaction"""
+        transaction.position_shares = total_shares
+        transaction.position_cost_basis = total_investment
+        transaction.position_average_cost = total_investment / total_shares if total_shares > 0 else Decimal('0')
+    
+    @staticmethod
+    def snapshot_new_transaction(stock, transaction):
+        """
+        Snapshot a newly added transaction from the stock's updated position. A back-dated
+        transaction shifts every later position, so those are replayed from it.
+        """
+        from backend.models import StockTransaction
+        
+        StockService.set_position_snapshot(transaction, stock.no_of_shares, stock.total_cost_basis)
+        db.session.flush()
+        
+        later = StockTransaction.query.filter(
+            StockTransaction.stock_id == stock.id,
+            StockTransaction.id != transaction.id,
+            StockTransaction.transaction_date > transaction.transaction_date
+        ).first()
+        if later:
+            StockService.recalculate_stock_from_transactions(
+                stock.id, transaction.transaction_date, transaction.id
+            )
+    
+    @staticmethod
+    def recalculate_stock_from_transactions(stock_id, from_date=None, from_id=None):
+        """
+        Recalculate stock portfolio from its transactions. When the first changed transaction
+        (from_date, from_id) is given, replay starts from the snapshot just before it instead of
+        from the first trade; without it, or when that snapshot is missing, all transactions are replayed.
+        """
         from backend.models import StockPortfolio, StockTransaction
+        from sqlalchemy import and_, or_
         
         stock = StockPortfolio.query.get_or_404(stock_id)
-        transactions = StockTransaction.query.filter_by(
-            stock_id=stock_id
-        ).order_by(StockTransaction.transaction_date.asc()).all()
+        query = StockTransaction.query.filter_by(stock_id=stock_id)
+        order = (StockTransaction.transaction_date.asc(), StockTransaction.id.asc())
         
         # Reset stock values
         total_shares = Decimal('0')
         total_investment = Decimal('0')
         
-        # Process all transactions in chronological order
-        for transaction in transactions:
-            if transaction.transaction_type == 'BUY':
-                total_shares += transaction.shares
-                total_investment += transaction.total_amount
-            elif transaction.transaction_type == 'SELL':
-                if total_shares > 0:
-                    # Calculate average cost before sell
-                    avg_cost = total_investment / total_shares if total_shares > 0 else Decimal('0')
-                    cost_of_sold = transaction.shares * avg_cost
-                    total_shares -= transaction.shares
-                    total_investment -= cost_of_sold
+        if from_date is not None:
+            from_id = from_id or 0
+            before = or_(
+                StockTransaction.transaction_date < from_date,
+                and_(StockTransaction.transaction_date == from_date, StockTransaction.id < from_id)
+            )
+            previous = query.filter(before).order_by(
+                StockTransaction.transaction_date.desc(), StockTransaction.id.desc()
+            ).first()
+            
+            if previous is None:
+                pass  # Changed transaction is the first one: replay everything
+            elif previous.position_shares is not None and previous.position_cost_basis is not None:
+                total_shares = previous.position_shares
+                total_investment = previous.position_cost_basis
+                query = query.filter(~before)
+        
+        # Process transactions in chronological order, snapshotting each position
+        for transaction in query.order_by(*order).all():
+            total_shares, total_investment = StockService.apply_transaction(
+                total_shares, total_investment, transaction
+            )
+            StockService.set_position_snapshot(transaction, total_shares, total_investment)
         
         # Update stock with recalculated values
         stock.no_of_shares = total_shares
@@ -308,4 +641,61 @@ class StockService:
         # Update current values and YTD
         stock.update_values()
         
-        return stock
\ No newline at end of file
+        return stock
+    
+    @staticmethod
+    def check_position_snapshots(stock_id=None, tolerance=Decimal('0.0001')):
+        """
+        Verify stored position snapshots (and each stock's totals) against a full replay.
+        Returns a list of mismatches; an empty list means everything is consistent.
+        """
+        from backend.models import StockPortfolio, StockTransaction
+        
+        stocks = StockPortfolio.query
+        transactions = StockTransaction.query
+        if stock_id is not None:
+            stocks = stocks.filter_by(id=stock_id)
+            transactions = transactions.filter_by(stock_id=stock_id)
+        
+        by_stock = {}
+        for transaction in transactions.order_by(
+            StockTransaction.stock_id, StockTransaction.transaction_date, StockTransaction.id
+        ).all():
+            by_stock.setdefault(transaction.stock_id, []).append(transaction)
+        
+        def differs(expected, actual):
+            return actual is None or abs(Decimal(expected) - Decimal(actual)) > tolerance
+        
+        mismatches = []
+        for stock in stocks.all():
+            total_shares = Decimal('0')
+            total_investment = Decimal('0')
+            
+            for transaction in by_stock.get(stock.id, []):
+                total_shares, total_investment = StockService.apply_transaction(
+                    total_shares, total_investment, transaction
+                )
+                for field, expected in (('position_shares', total_shares),
+                                        ('position_cost_basis', total_investment)):
+                    actual = getattr(transaction, field)
+                    if differs(expected, actual):
+                        mismatches.append({
+                            'stock_id': stock.id,
+                            'transaction_id': transaction.id,
+                            'field': field,
+                            'expected': str(expected),
+                            'actual': None if actual is None else str(actual)
+                        })
+            
+            for field, expected in (('no_of_shares', total_shares), ('total_cost_basis', total_investment)):
+                actual = getattr(stock, field)
+                if differs(expected, actual or 0):
+                    mismatches.append({
+                        'stock_id': stock.id,
+                        'transaction_id': None,
+                        'field': field,
+                        'expected': str(expected),
+                        'actual': None if actual is None else str(actual)
+                    })
+        
+        return mismatches
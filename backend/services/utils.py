@@ -6,6 +6,7 @@ from flask import session
 
 from backend.models import Project, ProjectActivity, ProjectCategory, ProjectTask
 from ..extension import db
+from backend.services.project_stats_service import get_project_statistics
 from sqlalchemy import text
 
 def get_period_label(period, today=None):
@@ -260,60 +261,20 @@ def format_balance_sheet_value(value):
 def get_project_stats():
     """Get statistics for projects dashboard"""
     try:
-        investment_count = Project.query.join(ProjectCategory).filter(
-            ProjectCategory.name == 'Investment'
-        ).count()
+        stats = get_project_statistics()
     except:
-        investment_count = 0
-    
-    try:
-        associate_count = Project.query.join(ProjectCategory).filter(
-            ProjectCategory.name == 'Associate'
-        ).count()
-    except:
-        associate_count = 0
-    
-    try:
-        subsidiary_count = Project.query.join(ProjectCategory).filter(
-            ProjectCategory.name == 'Subsidiary'
-        ).count()
-    except:
-        subsidiary_count = 0
+        stats = {'category_counts': {}, 'total_budget': 0}
 
-    try:
-        equity_count = Project.query.join(ProjectCategory).filter(
-            ProjectCategory.name == 'Equity'
-        ).count()
-    except:
-        equity_count = 0
+    category_counts = stats['category_counts']
 
-    try:
-        maual_fund_count = Project.query.join(ProjectCategory).filter(
-            ProjectCategory.name == 'Maual Fund'
-        ).count()
-    except:
-        maual_fund_count = 0
-
-    try:
-        join_ventaure_count = Project.query.join(ProjectCategory).filter(
-            ProjectCategory.name == 'Join Ventaure'
-        ).count()
-    except:
-        join_ventaure_count = 0
-    
-    try:
-        total_budget = db.session.query(db.func.sum(Project.budget)).scalar() or 0
-    except:
-        total_budget = 0
-    
     return {
-        'investment_projects_count': investment_count,
-        'associate_projects_count': associate_count,
-        'subsidiary_projects_count': subsidiary_count,
-        'equity_projects_count': equity_count,
-        'maual_fund_projects_count': maual_fund_count,
-        'join_ventaure_projects_count': join_ventaure_count,
-        'total_budget': total_budget
+        'investment_projects_count': category_counts.get('Investment', 0),
+        'associate_projects_count': category_counts.get('Associate', 0),
+        'subsidiary_projects_count': category_counts.get('Subsidiary', 0),
+        'equity_projects_count': category_counts.get('Equity', 0),
+        'maual_fund_projects_count': category_counts.get('Maual Fund', 0),
+        'join_ventaure_projects_count': category_counts.get('Join Ventaure', 0),
+        'total_budget': stats['total_budget'] or 0
     }
 
 def create_initial_project_categories():
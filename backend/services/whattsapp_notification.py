@@ -2,6 +2,9 @@
 from flask import current_app as app
 import requests
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from twilio.rest import Client  # Add this import
 
 def format_phone_number(phone_number):
@@ -27,27 +30,9 @@ def format_phone_number(phone_number):
     
     return cleaned
 
-def send_whatsapp_notification(event, phone_numbers):
-    """Send WhatsApp notification for calendar event using Twilio Client"""
-    try:
-        # Check if WhatsApp is configured
-        account_sid = app.config.get('WHATSAPP_ACCOUNT_SID')
-        auth_token = app.config.get('WHATSAPP_AUTH_TOKEN')
-        from_number = app.config.get('WHATSAPP_FROM_NUMBER')
-        sandbox_phrase = app.config.get('WHATSAPP_SANDBOX_PHRASE', 'join planned-pitch')
-        
-        app.logger.info(f"WhatsApp Config - SID: {account_sid}, From: {from_number}")
-        
-        if not all([account_sid, auth_token, from_number]):
-            app.logger.error("WhatsApp credentials not configured properly")
-            return False
-            
-        if not phone_numbers:
-            app.logger.warning("No phone numbers to send WhatsApp to")
-            return False
-        
-        # Create WhatsApp message
-        message_body = f"""
+def build_whatsapp_message(event):
+    """Build the WhatsApp message body for a calendar event"""
+    return f"""
         *Event Invitation: *{event.title.upper()}* 🔔
 
         📅 *Date & Time:* {event.start_datetime.strftime('%A, %B %d, %Y at %I:%M %p')}
@@ -63,71 +48,123 @@ def send_whatsapp_notification(event, phone_numbers):
 
        _This is an automated notification from RSR Calendar System_
         """.strip()
+
+class TwilioWhatsAppTransport:
+    """Send WhatsApp messages through the Twilio API"""
+
+    def __init__(self, account_sid, auth_token):
+        self.client = Client(account_sid, auth_token)
+
+    def send(self, from_number, to_number, body):
+        message = self.client.messages.create(body=body, from_=from_number, to=to_number)
+        return message.sid
+
+class FakeWhatsAppTransport:
+    """Record WhatsApp messages in memory instead of sending them (offline testing)"""
+    sent = []
+
+    def send(self, from_number, to_number, body):
+        self.sent.append({'from': from_number, 'to': to_number, 'body': body})
+        return f'FAKE{len(self.sent)}'
+
+class RateLimiter:
+    """Space calls evenly so at most `rate` calls start per second across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def get_whatsapp_transport():
+    """Return the configured WhatsApp transport, or None when WhatsApp is not configured"""
+    if app.config.get('NOTIFICATION_TRANSPORT') == 'fake':
+        return FakeWhatsAppTransport()
+
+    account_sid = app.config.get('WHATSAPP_ACCOUNT_SID')
+    auth_token = app.config.get('WHATSAPP_AUTH_TOKEN')
+    if not all([account_sid, auth_token, app.config.get('WHATSAPP_FROM_NUMBER')]):
+        return None
+    return TwilioWhatsAppTransport(account_sid, auth_token)
+
+def send_whatsapp_notification(event, phone_numbers, transport=None):
+    """
+    Send WhatsApp notification for calendar event, fanning out concurrently under a rate limit.
+    Returns one result dict (recipient, status, error, reference) per phone number.
+    """
+    from_number = app.config.get('WHATSAPP_FROM_NUMBER', '')
+    sandbox_phrase = app.config.get('WHATSAPP_SANDBOX_PHRASE', 'join planned-pitch')
+    
+    app.logger.info(f"WhatsApp Config - From: {from_number}")
+    
+    transport = transport or get_whatsapp_transport()
+    if transport is None:
+        app.logger.error("WhatsApp credentials not configured properly")
+        return [{'recipient': number, 'status': 'failed', 'error': 'WhatsApp not configured', 'reference': None}
+                for number in phone_numbers]
         
-        # Initialize Twilio client
-        client = Client(account_sid, auth_token)
-        
-        success_count = 0
-        failed_numbers = []
-        optin_required_numbers = []
-        
-        # Send to each phone number
-        for phone_number in phone_numbers:
-            try:
-                # Format phone number to E.164 format
-                formatted_number = format_phone_number(phone_number.strip())
-                to_number = f'whatsapp:{formatted_number}'
-                
-                app.logger.info(f"Sending WhatsApp from {from_number} to {to_number}")
-
-                # Send message using Twilio client
-                message = client.messages.create(
-                    body=message_body,
-                    from_=from_number,
-                    to=to_number
-                )
-                
-                if message.sid:
-                    app.logger.info(f"WhatsApp sent successfully to {to_number}, SID: {message.sid}")
-                    success_count += 1
-                else:
-                    app.logger.error(f"Failed to send WhatsApp to {to_number}")
-                    failed_numbers.append(phone_number)
-                    
-            except Exception as e:
-                error_msg = str(e)
-                app.logger.error(f"Error sending to {phone_number}: {error_msg}")
-                
-                # Check if it's an opt-in error
-                if "opt-in" in error_msg.lower() or "63007" in error_msg:
-                    optin_required_numbers.append(formatted_number)
-                    app.logger.warning(f"Opt-in required for {formatted_number}")
-                else:
-                    failed_numbers.append(phone_number)
-
-        # Handle users who need to opt-in
-        if optin_required_numbers:
-            app.logger.warning("🔔 OPT-IN REQUIRED FOR THESE NUMBERS:")
-            for number in optin_required_numbers:
-                app.logger.warning(f"  - {number} needs to send '{sandbox_phrase}' to {from_number}")
-        
-        app.logger.info(f"WhatsApp results: {success_count} successful, {len(failed_numbers)} failed, {len(optin_required_numbers)} need opt-in")
-        
-        # Log detailed instructions for users
-        if optin_required_numbers:
-            app.logger.info(f"""
-            📋 INSTRUCTIONS FOR USERS:
-            1. Open WhatsApp on your phone
-            2. Send this exact message: '{sandbox_phrase}'
-            3. To this number: {from_number.replace('whatsapp:', '')}
-            4. Wait for confirmation from WhatsApp
-            5. You will then receive event notifications
-            """)
-            
-        return success_count > 0
+    if not phone_numbers:
+        app.logger.warning("No phone numbers to send WhatsApp to")
+        return []
+    
+    # Create WhatsApp message
+    message_body = build_whatsapp_message(event)
+    limiter = RateLimiter(app.config.get('WHATSAPP_RATE_LIMIT', 5))
+    logger = app.logger
+    
+    def send_one(phone_number):
+        # Format phone number to E.164 format
+        formatted_number = format_phone_number(phone_number.strip())
+        to_number = f'whatsapp:{formatted_number}'
+        try:
+            limiter.wait()
+            sid = transport.send(from_number, to_number, message_body)
+            if sid:
+                logger.info(f"WhatsApp sent successfully to {to_number}, SID: {sid}")
+                return {'recipient': formatted_number, 'status': 'sent', 'error': None, 'reference': sid}
+            logger.error(f"Failed to send WhatsApp to {to_number}")
+            return {'recipient': formatted_number, 'status': 'failed', 'error': 'No message SID returned', 'reference': None}
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"Error sending to {phone_number}: {error_msg}")
             
-    except Exception as e:
-        app.logger.error(f"Failed to send WhatsApp notification: {str(e)}")
-        import traceback
-        app.logger.error(f"Traceback: {traceback.format_exc()}")
-        return False
\ No newline at end of file
+            # Check if it's an opt-in error
+            if "opt-in" in error_msg.lower() or "63007" in error_msg:
+                logger.warning(f"Opt-in required for {formatted_number}")
+                return {'recipient': formatted_number, 'status': 'optin_required', 'error': error_msg, 'reference': None}
+            return {'recipient': formatted_number, 'status': 'failed', 'error': error_msg, 'reference': None}
+    
+    with ThreadPoolExecutor(max_workers=app.config.get('WHATSAPP_MAX_WORKERS', 4)) as executor:
+        results = list(executor.map(send_one, phone_numbers))
+    
+    optin_required_numbers = [r['recipient'] for r in results if r['status'] == 'optin_required']
+    success_count = sum(1 for r in results if r['status'] == 'sent')
+    failed_count = sum(1 for r in results if r['status'] == 'failed')
+
+    # Handle users who need to opt-in
+    if optin_required_numbers:
+        app.logger.warning("🔔 OPT-IN REQUIRED FOR THESE NUMBERS:")
+        for number in optin_required_numbers:
+            app.logger.warning(f"  - {number} needs to send '{sandbox_phrase}' to {from_number}")
+    
+    app.logger.info(f"WhatsApp results: {success_count} successful, {failed_count} failed, {len(optin_required_numbers)} need opt-in")
+    
+    # Log detailed instructions for users
+    if optin_required_numbers:
+        app.logger.info(f"""
+        📋 INSTRUCTIONS FOR USERS:
+        1. Open WhatsApp on your phone
+        2. Send this exact message: '{sandbox_phrase}'
+        3. To this number: {from_number.replace('whatsapp:', '')}
+        4. Wait for confirmation from WhatsApp
+        5. You will then receive event notifications
+        """)
+        
+    return results
@@ -1,20 +1,59 @@
 # backend/upload_excel_data.py
 import os
 import sys
+import io
+import math
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import re
 
 # Check for required dependencies before proceeding
 try:
     import pandas as pd
+    from pandas.io.parsers import TextParser
     import mysql.connector
-    from mysql.connector import Error
+    from mysql.connector import Error, errorcode
 except ImportError as e:
+    # Imported by the app's upload job too, which reports the ImportError itself
+    if __name__ != "__main__":
+        raise
     print(f"Missing required dependency: {e}")
     print("Please install the required packages:")
     print("pip install pandas mysql-connector-python openpyxl")
     sys.exit(1)
 
+# Times a per-sheet writer retries after losing a deadlock on shared account items
+DEADLOCK_RETRIES = 3
+
+# Rebuilds associate_summaries (latest-year headline figures per associate) from associate_financials
+SUMMARY_SNAPSHOT_QUERY = """
+    INSERT INTO associate_summaries
+    (company_id, latest_year, total_assets, total_equity, net_profit, gross_profit, data_version, built_at)
+    SELECT f.company_id, f.financial_year,
+        MAX(CASE WHEN i.name = 'Total assets' THEN f.amount END),
+        MAX(CASE WHEN i.name = 'Total equity' THEN f.amount END),
+        MAX(CASE WHEN i.name = 'Profit & loss' THEN f.amount END),
+        MAX(CASE WHEN i.name = 'Gross (loss) / profit' THEN f.amount END),
+        %s, %s
+    FROM associate_financials f
+    JOIN (
+        SELECT company_id, MAX(financial_year) AS financial_year
+        FROM associate_financials GROUP BY company_id
+    ) latest ON latest.company_id = f.company_id AND latest.financial_year = f.financial_year
+    JOIN associate_account_items i ON i.id = f.account_item_id
+    GROUP BY f.company_id, f.financial_year
+    ON DUPLICATE KEY UPDATE
+        latest_year = VALUES(latest_year),
+        total_assets = VALUES(total_assets),
+        total_equity = VALUES(total_equity),
+        net_profit = VALUES(net_profit),
+        gross_profit = VALUES(gross_profit),
+        data_version = VALUES(data_version),
+        built_at = VALUES(built_at)
+"""
+
 class ExcelToDBUploader:
     def __init__(self, db_config):
         self.db_config = db_config
@@ -137,15 +176,13 @@ class ExcelToDBUploader:
         
         return year_columns
     
-    def process_sheet_data(self, sheet_name, sheet_data):
-        """Process data from a single sheet"""
-        processed_data = []
-        
+    def sheet_layout(self, sheet_name, sheet_data):
+        """Table name, account items column and year columns of a sheet, or None when it can't be processed"""
         # Get the table name for this company
         table_name = self.companies_mapping.get(sheet_name)
         if not table_name:
             print(f"No table mapping found for company: {sheet_name}")
-            return processed_data
+            return None
         
         print(f"Processing {sheet_name} -> {table_name}")
         
@@ -158,9 +195,103 @@ class ExcelToDBUploader:
         
         if not year_columns:
             print(f"Could not find year columns for {sheet_name}")
-            return processed_data
+            return None
         
         print(f"Found {len(year_columns)} year columns: {[year for _, year, _ in year_columns]}")
+        return table_name, account_col_idx, year_columns
+    
+    def clean_account_items(self, items):
+        """Vectorized clean_account_item over a Series; rows that are not account names become None"""
+        cleaned = pd.Series([None] * len(items), index=items.index, dtype=object)
+        
+        text = items[items.notna()].map(str).str.strip()
+        text = text[~text.isin(['', '=', '0'])]
+        text = text.str.replace(r'^=.*', '', regex=True)
+        text = text.str.replace('<br>', ' ', regex=False)
+        text = text.str.replace(r'\s+', ' ', regex=True).str.strip()
+        text = text[(text.str.len() >= 2) & ~text.str.isdigit()]
+        
+        cleaned[text.index] = text
+        return cleaned
+    
+    def parse_amounts(self, values):
+        """
+        Vectorized amount parsing over a Series of raw cells, with the same rules as the row-by-row
+        path: blanks, '=', '0', formulas and text are dropped. Returns the parsed floats by position.
+        """
+        raw = values[values.notna()].map(str)
+        raw = raw[~raw.str.strip().isin(['', '=', '0'])]
+        
+        text = raw.str.replace(',', '', regex=False).str.strip()
+        text = text[
+            (text != '') &
+            ~text.str.startswith('=') &
+            ~text.str.startswith('SUM(') &
+            ~text.str.isalpha()
+        ]
+        
+        # pd.to_numeric finds the parseable cells; float() then parses them exactly as before
+        numeric = pd.to_numeric(text, errors='coerce').notna()
+        try:
+            amounts = pd.Series(text[numeric].astype(float).tolist(), index=text[numeric].index, dtype=object)
+        except ValueError:
+            numeric[:] = False
+            amounts = pd.Series([], dtype=object)
+        
+        # Anything to_numeric rejects but float() accepts (e.g. '1_000') is rare enough to try one by one
+        for position, amount_str in text[~numeric].items():
+            try:
+                amounts[position] = float(amount_str)
+            except (ValueError, TypeError):
+                continue
+        
+        return amounts.sort_index()
+    
+    def process_sheet_data(self, sheet_name, sheet_data):
+        """
+        Process data from a single sheet. The sheet is melted into one long (row, year) series,
+        cleaned and parsed with vectorized operations; records come out in the same order and
+        with the same values as process_sheet_data_rowwise.
+        """
+        processed_data = []
+        
+        layout = self.sheet_layout(sheet_name, sheet_data)
+        if not layout:
+            return processed_data
+        table_name, account_col_idx, year_columns = layout
+        
+        # The same cell values iterrows() would yield
+        cells = sheet_data.values
+        account_items = self.clean_account_items(pd.Series(cells[:, account_col_idx], dtype=object))
+        rows = account_items.index[account_items.notna()].to_numpy()
+        
+        # Melt the year columns of the kept rows in row-major order: cell k is row k // n, year k % n
+        n_years = len(year_columns)
+        melted = pd.Series(cells[rows][:, [col_idx for col_idx, _, _ in year_columns]].ravel(), dtype=object)
+        amounts = self.parse_amounts(melted)
+        
+        years = [year for _, year, _ in year_columns]
+        items = account_items.to_numpy()[rows].tolist()
+        for position, amount_value in zip(amounts.index.tolist(), amounts.tolist()):
+            processed_data.append({
+                'company_name': sheet_name,
+                'financial_year': years[position % n_years],
+                'account_item': items[position // n_years],
+                'amount': amount_value,
+                'table_name': table_name
+            })
+        
+        print(f"Processed {len(processed_data)} records for {sheet_name}")
+        return processed_data
+    
+    def process_sheet_data_rowwise(self, sheet_name, sheet_data):
+        """Row-by-row reference implementation of process_sheet_data"""
+        processed_data = []
+        
+        layout = self.sheet_layout(sheet_name, sheet_data)
+        if not layout:
+            return processed_data
+        table_name, account_col_idx, year_columns = layout
         
         # Process each row
         for idx, row in sheet_data.iterrows():
@@ -200,8 +331,131 @@ class ExcelToDBUploader:
         print(f"Processed {len(processed_data)} records for {sheet_name}")
         return processed_data
     
+    def get_company_id(self, cursor, company_code):
+        """Find the associate_companies row for a sheet, creating it for new associates"""
+        cursor.execute("SELECT id FROM associate_companies WHERE company_code = %s", (company_code,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        
+        cursor.execute(
+            "INSERT INTO associate_companies (company_code, company_name, display_name, is_active, created_at, updated_at) "
+            "VALUES (%s, %s, %s, 1, %s, %s)",
+            (company_code, company_code, company_code, datetime.now(), datetime.now())
+        )
+        return cursor.lastrowid
+    
+    def get_account_item_ids(self, cursor, names):
+        """
+        Map account item names to associate_account_items ids, adding any new items.
+        Keys are lower-cased since the name column compares case-insensitively.
+        """
+        names = sorted(set(names))
+        cursor.executemany(
+            "INSERT IGNORE INTO associate_account_items (name, created_at) VALUES (%s, %s)",
+            [(name, datetime.now()) for name in names]
+        )
+        
+        placeholders = ', '.join(['%s'] * len(names))
+        cursor.execute(f"SELECT id, name FROM associate_account_items WHERE name IN ({placeholders})", names)
+        return {name.lower(): item_id for item_id, name in cursor.fetchall()}
+    
+    def rebuild_summary_snapshot(self, cursor):
+        """Rebuild associate_summaries under a new data version, in the caller's transaction"""
+        cursor.execute("SELECT COALESCE(MAX(data_version), 0) + 1 FROM associate_summaries")
+        version = cursor.fetchone()[0]
+        
+        cursor.execute(SUMMARY_SNAPSHOT_QUERY, (version, datetime.now()))
+        cursor.execute("DELETE FROM associate_summaries WHERE data_version <> %s", (version,))
+        return version
+    
+    def stored_amount(self, amount):
+        """An uploaded amount as associate_financials stores it (DECIMAL(18,2)), for comparison"""
+        if amount is None or not math.isfinite(amount):
+            return None
+        return Decimal(repr(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    
+    def write_records(self, cursor, data, verbose=True):
+        """
+        Bring each company's rows in associate_financials in line with `data`, in the caller's transaction.
+        Rows are diffed on the (company, year, account item) unique key: only new or changed amounts are
+        written, and rows the workbook no longer has are deleted. Returns inserted/updated/unchanged/deleted counts.
+        `verbose=False` skips the per-company line, for callers that report progress themselves.
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        if not data:
+            return counts
+        
+        # Group data by company
+        data_by_company = {}
+        for record in data:
+            data_by_company.setdefault(record['company_name'], []).append(record)
+        
+        item_ids = self.get_account_item_ids(cursor, [record['account_item'] for record in data])
+        
+        upsert_query = """
+            INSERT INTO associate_financials 
+            (company_id, financial_year, account_item_id, amount, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE amount = VALUES(amount), updated_at = VALUES(updated_at)
+        """
+        
+        for company_name, records in data_by_company.items():
+            company_id = self.get_company_id(cursor, company_name)
+            
+            cursor.execute(
+                "SELECT financial_year, account_item_id, amount FROM associate_financials WHERE company_id = %s",
+                (company_id,)
+            )
+            existing = {(year, item_id): amount for year, item_id, amount in cursor.fetchall()}
+            
+            # A line item repeated within a sheet keeps its last amount
+            uploaded = {}
+            for record in records:
+                key = (record['financial_year'], item_ids[record['account_item'].lower()])
+                uploaded[key] = self.stored_amount(record['amount'])
+            
+            now = datetime.now()
+            changes = []
+            for key, amount in uploaded.items():
+                if key not in existing:
+                    counts['inserted'] += 1
+                elif existing[key] != amount:
+                    counts['updated'] += 1
+                else:
+                    counts['unchanged'] += 1
+                    continue
+                changes.append((company_id, key[0], key[1], amount, now, now))
+            
+            removed = [(company_id, year, item_id) for year, item_id in existing.keys() - uploaded.keys()]
+            
+            if changes:
+                cursor.executemany(upsert_query, changes)
+            if removed:
+                cursor.executemany(
+                    "DELETE FROM associate_financials WHERE company_id = %s AND financial_year = %s AND account_item_id = %s",
+                    removed
+                )
+            counts['deleted'] += len(removed)
+            if verbose:
+                print(f"{company_name}: {len(changes)} rows written, {len(uploaded) - len(changes)} unchanged, {len(removed)} removed")
+        
+        return counts
+    
+    def finish_upload(self, cursor, counts):
+        """Rebuild the summary snapshot if anything changed, then commit"""
+        print(
+            f"Upload complete: {counts['inserted']} inserted, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged, {counts['deleted']} deleted"
+        )
+        # An unchanged upload keeps the current data version, so cached catalogues and ETags stay valid
+        if counts['inserted'] or counts['updated'] or counts['deleted']:
+            version = self.rebuild_summary_snapshot(cursor)
+            print(f"Associate summary snapshot rebuilt (version {version})")
+        self.connection.commit()
+    
     def upload_to_database(self, data):
-        """Upload processed data to database"""
+        """Upload processed data to the associate_financials table"""
         if not data:
             print("No data to upload")
             return
@@ -209,45 +463,132 @@ class ExcelToDBUploader:
         cursor = self.connection.cursor()
         
         try:
-            # Group data by table
-            data_by_table = {}
-            for record in data:
-                table_name = record['table_name']
-                if table_name not in data_by_table:
-                    data_by_table[table_name] = []
-                data_by_table[table_name].append(record)
+            counts = self.write_records(cursor, data)
+            self.finish_upload(cursor, counts)
+            return counts
             
-            total_inserted = 0
+        except Error as e:
+            print(f"Error uploading data: {e}")
+            self.connection.rollback()
+        finally:
+            cursor.close()
+    
+    def read_sheet_rows(self, sheet):
+        """
+        Stream a read-only worksheet into row lists the way pandas' openpyxl reader does:
+        integral floats become ints, error cells become NaN, trailing blanks are trimmed
+        """
+        from openpyxl.cell.cell import ERROR_CODES
+        
+        rows = []
+        last_row_with_data = -1
+        for row_number, values in enumerate(sheet.iter_rows(values_only=True)):
+            row = []
+            for value in values:
+                if value is None:
+                    value = ""
+                elif isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                elif isinstance(value, str) and value in ERROR_CODES:
+                    value = float('nan')
+                row.append(value)
             
-            for table_name, records in data_by_table.items():
-                print(f"Uploading {len(records)} records to {table_name}")
+            while row and row[-1] == "":
+                row.pop()
+            if row:
+                last_row_with_data = row_number
+            rows.append(row)
+        
+        rows = rows[:last_row_with_data + 1]
+        if rows:
+            width = max(len(row) for row in rows)
+            rows = [row + [""] * (width - len(row)) for row in rows]
+        return rows
+    
+    def iter_sheets(self, excel_file_path):
+        """
+        Yield (sheet_name, DataFrame) one sheet at a time from a read-only workbook, so only one
+        sheet is held in memory. Sheets without a table mapping are yielded as None, unparsed.
+        """
+        import openpyxl
+        
+        workbook = openpyxl.load_workbook(excel_file_path, read_only=True, data_only=True, keep_links=False)
+        try:
+            for sheet in workbook.worksheets:
+                if sheet.title not in self.companies_mapping:
+                    yield sheet.title, None
+                    continue
                 
-                # Clear existing data for this company to avoid duplicates
-                delete_query = f"DELETE FROM {table_name} WHERE company_name = %s"
-                cursor.execute(delete_query, (records[0]['company_name'],))
+                yield sheet.title, self.sheet_frame(sheet)
+        finally:
+            workbook.close()
+    
+    def sheet_frame(self, sheet):
+        """Read a read-only worksheet into a DataFrame, as pd.read_excel would"""
+        # Read-only sheets can report stale dimensions
+        sheet.reset_dimensions()
+        rows = self.read_sheet_rows(sheet)
+        return TextParser(rows, header=0).read() if rows else pd.DataFrame()
+    
+    def mapped_sheet_names(self, excel_file_path):
+        """Names of the workbook's sheets that have a table mapping, without reading any cells"""
+        import openpyxl
+        
+        workbook = openpyxl.load_workbook(excel_file_path, read_only=True, keep_links=False)
+        try:
+            return [name for name in workbook.sheetnames if name in self.companies_mapping]
+        finally:
+            workbook.close()
+    
+    def write_sheet(self, sheet_name, records):
+        """
+        Write one sheet's records on a connection of its own and commit them, so a sheet that
+        fails to write leaves the others in place. Deadlocks on shared account items are retried.
+        """
+        connection = mysql.connector.connect(**self.db_config)
+        cursor = connection.cursor()
+        try:
+            for attempt in range(DEADLOCK_RETRIES + 1):
+                try:
+                    # Writers run in threads: the parent prints their progress
+                    counts = self.write_records(cursor, records, verbose=False)
+                    connection.commit()
+                    return counts
+                except Error as e:
+                    connection.rollback()
+                    if e.errno != errorcode.ER_LOCK_DEADLOCK or attempt == DEADLOCK_RETRIES:
+                        raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def upload_excel_file_streaming(self, excel_file_path):
+        """
+        Parse and write one sheet at a time, releasing each before the next is read, so peak
+        memory follows the largest sheet rather than the workbook. All sheets share one transaction.
+        """
+        cursor = self.connection.cursor()
+        
+        try:
+            counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+            for sheet_name, sheet_data in self.iter_sheets(excel_file_path):
+                print(f"\n{'='*50}")
+                print(f"Processing sheet: {sheet_name}")
+                print(f"{'='*50}")
                 
-                insert_query = f"""
-                    INSERT INTO {table_name} 
-                    (company_name, financial_year, account_item, amount, created_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                """
+                if sheet_data is None:
+                    print(f"Skipping sheet '{sheet_name}' - no table mapping")
+                    continue
                 
-                batch_data = []
-                for record in records:
-                    batch_data.append((
-                        record['company_name'],
-                        record['financial_year'],
-                        record['account_item'],
-                        record['amount'],
-                        datetime.now()
-                    ))
+                processed_data = self.process_sheet_data(sheet_name, sheet_data)
+                for key, count in self.write_records(cursor, processed_data).items():
+                    counts[key] += count
                 
-                cursor.executemany(insert_query, batch_data)
-                total_inserted += cursor.rowcount
-                print(f"Uploaded {cursor.rowcount} records to {table_name}")
+                # Drop this sheet before the generator reads the next one
+                del sheet_data, processed_data
             
-            self.connection.commit()
-            print(f"Successfully uploaded {total_inserted} total records to database")
+            self.finish_upload(cursor, counts)
+            return counts
             
         except Error as e:
             print(f"Error uploading data: {e}")
@@ -255,7 +596,68 @@ class ExcelToDBUploader:
         finally:
             cursor.close()
     
-    def upload_excel_file(self, excel_file_path):
+    def upload_excel_file_parallel(self, excel_file_path, workers=None):
+        """
+        Parse sheets in a process pool and hand each one, as soon as it is parsed, to a writer
+        thread with its own connection. Every sheet commits on its own, so a malformed sheet is
+        reported and skipped without aborting the rest. Returns the counts and the failed sheets.
+        """
+        sheet_names = self.mapped_sheet_names(excel_file_path)
+        total = len(sheet_names)
+        workers = workers or os.cpu_count() or 1
+        print(f"Uploading {total} sheets with {workers} workers")
+        
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        failures = {}
+        parsed = written = 0
+        
+        with ProcessPoolExecutor(max_workers=workers) as parsers, ThreadPoolExecutor(max_workers=workers) as writers:
+            parsing = {parsers.submit(parse_sheet, excel_file_path, name): name for name in sheet_names}
+            writing = {}
+            
+            for future in as_completed(parsing):
+                sheet_name = parsing[future]
+                parsed += 1
+                try:
+                    records = future.result()
+                except Exception as e:
+                    failures[sheet_name] = f"parse failed: {e}"
+                    print(f"[parsed {parsed}/{total}] {sheet_name}: FAILED ({e})")
+                    continue
+                print(f"[parsed {parsed}/{total}] {sheet_name}: {len(records)} records")
+                writing[writers.submit(self.write_sheet, sheet_name, records)] = sheet_name
+            
+            for future in as_completed(writing):
+                sheet_name = writing[future]
+                written += 1
+                try:
+                    sheet_counts = future.result()
+                except Exception as e:
+                    failures[sheet_name] = f"write failed: {e}"
+                    print(f"[written {written}/{len(writing)}] {sheet_name}: FAILED ({e})")
+                    continue
+                for key, count in sheet_counts.items():
+                    counts[key] += count
+                print(
+                    f"[written {written}/{len(writing)}] {sheet_name}: {sheet_counts['inserted']} inserted, "
+                    f"{sheet_counts['updated']} updated, {sheet_counts['unchanged']} unchanged, {sheet_counts['deleted']} deleted"
+                )
+        
+        # The snapshot covers whatever did commit
+        cursor = self.connection.cursor()
+        try:
+            self.finish_upload(cursor, counts)
+        except Error as e:
+            print(f"Error rebuilding summary snapshot: {e}")
+            self.connection.rollback()
+        finally:
+            cursor.close()
+        
+        for sheet_name, error in failures.items():
+            print(f"Sheet '{sheet_name}' was not uploaded - {error}")
+        return counts, failures
+    
+    def upload_excel_file(self, excel_file_path, streaming=False, workers=None):
         """Main method to upload Excel file data"""
         if not self.connect_to_db():
             return False
@@ -263,6 +665,14 @@ class ExcelToDBUploader:
         try:
             print(f"Reading Excel file: {excel_file_path}")
             
+            if workers:
+                _, failures = self.upload_excel_file_parallel(excel_file_path, workers)
+                return not failures
+            
+            if streaming:
+                self.upload_excel_file_streaming(excel_file_path)
+                return True
+            
             # Read all sheets with explicit engine specification
             all_sheets_data = pd.read_excel(excel_file_path, sheet_name=None, engine='openpyxl')
             
@@ -296,6 +706,21 @@ class ExcelToDBUploader:
         finally:
             self.disconnect_from_db()
 
+def parse_sheet(excel_file_path, sheet_name):
+    """Process-pool entry point: read one sheet of the workbook and return its records"""
+    import openpyxl
+    
+    uploader = ExcelToDBUploader(db_config={})
+    workbook = openpyxl.load_workbook(excel_file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet_data = uploader.sheet_frame(workbook[sheet_name])
+    finally:
+        workbook.close()
+    
+    # Per-sheet chatter from the workers would interleave; the parent reports progress instead
+    with contextlib.redirect_stdout(io.StringIO()):
+        return uploader.process_sheet_data(sheet_name, sheet_data)
+
 # Configuration
 def get_db_config():
     """Get database configuration from environment variables or use defaults"""
@@ -338,7 +763,15 @@ if __name__ == "__main__":
     else:
         print(f"✓ Excel file found: {excel_file_path}")
         uploader = ExcelToDBUploader(get_db_config())
-        success = uploader.upload_excel_file(excel_file_path)
+        # --stream reads and uploads one sheet at a time for large workbooks;
+        # --workers N parses sheets in N processes and writes each on its own connection
+        workers = None
+        if '--workers' in sys.argv[1:]:
+            position = sys.argv.index('--workers')
+            workers = int(sys.argv[position + 1]) if position + 1 < len(sys.argv) else os.cpu_count()
+        success = uploader.upload_excel_file(
+            excel_file_path, streaming='--stream' in sys.argv[1:], workers=workers
+        )
         
         if success:
             print("\n" + "="*50)